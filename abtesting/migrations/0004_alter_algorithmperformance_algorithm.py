@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abtesting', '0003_alter_algorithmperformance_algorithm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='algorithmperformance',
+            name='algorithm',
+            field=models.CharField(choices=[('collaborative', 'Collaborative Filtering'), ('collaborative_item', 'Item-Item Collaborative Filtering'), ('svd', 'SVD Matrix Factorization'), ('content', 'Content-Based'), ('neural', 'Neural Collaborative Filtering'), ('hybrid', 'Hybrid Approach')], max_length=20),
+        ),
+    ]
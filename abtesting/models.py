@@ -28,8 +28,10 @@ class ABTestResult(models.Model):
 class AlgorithmComparison(models.Model):
     ALGORITHM_CHOICES = [
         ('collaborative', 'Collaborative Filtering'),
+        ('collaborative_item', 'Item-Item Collaborative Filtering'),
         ('svd', 'SVD Matrix Factorization'),
         ('content', 'Content-Based'),
+        ('neural', 'Neural Collaborative Filtering'),
         ('hybrid', 'Hybrid Approach'),
     ]
     
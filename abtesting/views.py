@@ -28,7 +28,7 @@ def algorithm_performance_dashboard(request):
     if comparison:
         performances = AlgorithmPerformance.objects.filter(comparison=comparison)
 
-        for algo in ['collaborative', 'svd', 'content', 'hybrid']:
+        for algo in ['collaborative', 'collaborative_item', 'svd', 'content', 'neural', 'hybrid']:
             algo_performances = performances.filter(algorithm=algo)
             if algo_performances.exists():
                 stats = algo_performances.aggregate(
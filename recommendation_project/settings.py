@@ -109,6 +109,36 @@ else:
     }
 
 
+# ----------------------------------------------
+# CACHE
+# ----------------------------------------------
+# Redis (the one Celery already uses) shares cached profiles, recommendations
+# and counters between workers; local memory is per process
+USE_REDIS_CACHE = os.environ.get('USE_REDIS_CACHE', 'False') == 'True'
+
+if USE_REDIS_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://localhost:6379/1'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'movie-recommender',
+        }
+    }
+
+# ----------------------------------------------
+# NEURAL MODEL SERVING
+# ----------------------------------------------
+# Milliseconds a neural scoring call waits for concurrent requests of the same
+# worker process to share its forward pass (0 disables; needs threaded workers)
+NEURAL_MICRO_BATCH_MS = float(os.environ.get('NEURAL_MICRO_BATCH_MS', '0'))
+
+
 # ----------------------------------------------
 # PASSWORD VALIDATION
 # ----------------------------------------------
@@ -191,6 +221,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'recommender.tasks.retrain_all_models',
         'schedule': 86400.0,  # 24 hours
     },
+    'drain-rating-events': {
+        'task': 'recommender.tasks.drain_rating_events',
+        'schedule': 60.0,  # 1 minute
+    },
     'process-pending-updates': {
         'task': 'recommender.tasks.process_model_updates',
         'schedule': 300.0,  # 5 minutes
@@ -9,7 +9,8 @@ from django.contrib.admin.views.decorators import staff_member_required
 from .models import (
     Movie, Rating, MovieInteraction, UserProfile,
     UserFollow, MovieComment, SharedRecommendation,
-    RecommendationExperiment, ModelUpdateTask, MovieList
+    RecommendationExperiment, ModelUpdateTask, MovieList,
+    PrecomputedRecommendation
 )
 
 
@@ -153,7 +154,7 @@ class ModelUpdateTaskAdmin(admin.ModelAdmin):
     search_fields = ['triggered_by_user__username', 'task_type']
     list_filter = ['status', 'task_type', 'created_at']
     ordering = ['-created_at']
-    readonly_fields = ['created_at', 'started_at', 'completed_at', 'duration']
+    readonly_fields = ['created_at', 'started_at', 'completed_at', 'duration', 'stage_durations']
 
     def duration(self, obj):
         if obj.started_at and obj.completed_at:
@@ -167,7 +168,7 @@ class ModelUpdateTaskAdmin(admin.ModelAdmin):
             'fields': ('task_type', 'status', 'triggered_by_user', 'triggered_by_rating')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'started_at', 'completed_at', 'duration')
+            'fields': ('created_at', 'started_at', 'completed_at', 'duration', 'stage_durations')
         }),
         ('Error Info', {
             'fields': ('error_message',),
@@ -176,6 +177,15 @@ class ModelUpdateTaskAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(PrecomputedRecommendation)
+class PrecomputedRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'algorithm', 'release', 'computed_at']
+    search_fields = ['user__username']
+    list_filter = ['algorithm', 'release']
+    ordering = ['-computed_at']
+    readonly_fields = ['computed_at']
+
+
 # ------------------------------------------------------------
 # SIMPLE GLOBAL ADMIN VIEW — NO ADMIN CLASS OVERRIDING
 # ------------------------------------------------------------
@@ -0,0 +1,159 @@
+"""
+Approximate nearest-neighbour search over item embeddings.
+
+An inverted-file (IVF) index: item vectors are clustered with k-means and
+stored grouped by cluster. A query is compared with the cluster centroids
+first and only the items of the ``n_probe`` best clusters are scored, so a
+lookup touches roughly ``n_probe / n_lists`` of the catalogue. ``n_probe``
+is the recall/latency knob; ``n_probe == n_lists`` is exact search.
+
+The index is a dict of NumPy arrays, so it is pickled inside the model
+artifact it was built from and published together with it.
+"""
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from .base import top_n
+from .neighbors import MAX_BLOCK_ELEMENTS
+
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 10
+# k-means is fitted on a sample of at most this many points per list
+SAMPLES_PER_LIST = 64
+# Below this catalogue size exact scoring is cheaper than probing an index
+MIN_ITEMS = 10000
+
+
+def default_n_lists(n_items):
+    return max(1, int(4 * np.sqrt(n_items)))
+
+
+def _assign(vectors, centroids, max_block_elements=MAX_BLOCK_ELEMENTS):
+    """Nearest centroid of every vector, computed in row blocks"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    block_size = max(1, max_block_elements // len(centroids))
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        labels[start:start + block_size] = (centroid_norms - 2 * block @ centroids.T).argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=42):
+    """Lloyd's k-means on a random sample of ``vectors``; returns the centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = SAMPLES_PER_LIST * n_clusters
+    sample = vectors if len(vectors) <= sample_size else vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        membership = csr_matrix(
+            (np.ones(len(sample), dtype=np.float32), (labels, np.arange(len(sample)))),
+            shape=(n_clusters, len(sample)),
+        )
+        counts = np.asarray(membership.sum(axis=1)).ravel()
+        filled = counts > 0
+        # Empty clusters keep their previous centroid
+        centroids[filled] = (membership @ sample)[filled] / counts[filled, None]
+    return centroids
+
+
+def build_ivf_index(vectors, n_lists=None, metric='ip', seed=42):
+    """
+    IVF index over the rows of ``vectors``. ``metric`` is ``'ip'`` (inner
+    product, for scoring user factors against item factors) or ``'cosine'``.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == 'cosine':
+        vectors = normalize(vectors, norm='l2', axis=1)
+    n_lists = min(n_lists or default_n_lists(len(vectors)), len(vectors))
+
+    centroids = kmeans(vectors, n_lists, seed=seed)
+    labels = _assign(vectors, centroids)
+    order = np.argsort(labels, kind='stable')
+
+    return {
+        'metric': metric,
+        'centroids': centroids.astype(np.float32),
+        'offsets': np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_lists)))).astype(np.int64),
+        'item_indices': order.astype(np.int32),
+        'vectors': np.ascontiguousarray(vectors[order]),
+    }
+
+
+class IVFIndex:
+    """Query side of an index returned by ``build_ivf_index``"""
+
+    def __init__(self, data):
+        self.metric = data['metric']
+        self.centroids = data['centroids']
+        self.offsets = data['offsets']
+        self.item_indices = data['item_indices']
+        self.vectors = data['vectors']
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.item_indices)
+
+    def search(self, query, n, n_probe=DEFAULT_N_PROBE, exclude=None):
+        """
+        Approximate top-``n`` as ``(item indices, scores)``, best first. Item
+        indices are rows of the matrix the index was built from; ``exclude``
+        lists indices that must not be returned.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if self.metric == 'cosine':
+            query = query / max(np.linalg.norm(query), 1e-12)
+
+        n_probe = min(max(1, n_probe), self.n_lists)
+        if n_probe < self.n_lists:
+            lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        else:
+            lists = np.arange(self.n_lists)
+
+        candidates = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+        items = self.item_indices[candidates]
+        scores = self.vectors[candidates] @ query
+        if exclude is not None and len(exclude):
+            scores[np.isin(items, exclude)] = -np.inf
+
+        top = top_n(scores, n)
+        return items[top].astype(np.int64), scores[top]
+
+
+def benchmark(index, vectors, queries, n=10, n_probes=(1, 2, 4, 8, 16, 32)):
+    """
+    Recall@n and per-query latency of ``index`` against exact brute-force
+    top-n over ``vectors`` for each ``n_probe``.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if index.metric == 'cosine':
+        vectors = normalize(vectors, norm='l2', axis=1)
+
+    start = time.perf_counter()
+    exact = [set(top_n(vectors @ query, n).tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    results = []
+    for n_probe in n_probes:
+        if n_probe > index.n_lists:
+            break
+        start = time.perf_counter()
+        found = [index.search(query, n, n_probe)[0] for query in queries]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = sum(len(truth.intersection(items.tolist())) for truth, items in zip(exact, found))
+        results.append({
+            'n_probe': n_probe,
+            'recall': hits / sum(len(truth) for truth in exact),
+            'ms_per_query': elapsed_ms,
+            'exact_ms_per_query': exact_ms,
+        })
+    return results
@@ -0,0 +1,98 @@
+"""
+Shared plumbing for the serving-side recommendation engines.
+
+An engine wraps one trained artifact from the model registry. ``score``
+returns one score per movie of the artifact's catalogue (or None when the
+user cannot be scored); ``recommend`` masks what the user already rated and
+picks the top-N with a partial sort.
+"""
+import numpy as np
+
+
+def top_n(scores, n, min_score=-np.inf):
+    """Indices of the ``n`` best scores above ``min_score``, best first"""
+    valid = np.flatnonzero(scores > min_score)
+    if n <= 0 or not len(valid):
+        return valid[:0]
+    if len(valid) > n:
+        valid = valid[np.argpartition(-scores[valid], n - 1)[:n]]
+    return valid[np.argsort(-scores[valid], kind='stable')]
+
+
+class BaseRecommender:
+    name = None
+    # Scores at or below this are never recommended
+    min_score = -np.inf
+    # Set by the model registry to the version of the artifact behind the engine
+    model_version = None
+
+    def __init__(self, model, movie_ids):
+        self.model = model
+        self.movie_ids = np.asarray(movie_ids)
+        self.movie_id_to_idx = {int(movie_id): idx for idx, movie_id in enumerate(self.movie_ids)}
+
+    def movie_indices(self, movie_ids):
+        """Catalogue positions of the given movie ids; unknown ids are dropped"""
+        return np.fromiter(
+            (self.movie_id_to_idx[m] for m in movie_ids if m in self.movie_id_to_idx),
+            dtype=np.int64,
+        )
+
+    def rated_vector(self, ratings):
+        """Catalogue indices and rating values for a {movie_id: rating} dict"""
+        known = [(self.movie_id_to_idx[m], r) for m, r in ratings.items() if m in self.movie_id_to_idx]
+        if not known:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        idx, values = zip(*known)
+        return np.asarray(idx, dtype=np.int64), np.asarray(values, dtype=np.float32)
+
+    def catalogue_positions(self, movie_ids):
+        """Catalogue position of every given movie id, -1 where it is unknown"""
+        return np.fromiter(
+            (self.movie_id_to_idx.get(m, -1) for m in movie_ids),
+            dtype=np.int64, count=len(movie_ids),
+        )
+
+    def score(self, user_id, ratings, **kwargs):
+        raise NotImplementedError
+
+    def score_items(self, user_id, ratings, movie_ids, **kwargs):
+        """
+        Scores aligned with ``movie_ids`` (-inf for movies the engine cannot
+        score). Engines that can score a subset directly override this.
+        """
+        result = np.full(len(movie_ids), -np.inf, dtype=np.float32)
+        scores = self.score(user_id, ratings, **kwargs)
+        if scores is not None:
+            positions = self.catalogue_positions(movie_ids)
+            known = positions >= 0
+            result[known] = np.asarray(scores)[positions[known]]
+        return result
+
+    def recommend(self, user_id, ratings, n=10, **kwargs):
+        """Top-N ``(movie_id, score)`` pairs the user has not rated yet"""
+        scores = self.score(user_id, ratings, **kwargs)
+        if scores is None:
+            return []
+        scores = np.array(scores, dtype=np.float64)
+        scores[self.movie_indices(ratings)] = -np.inf
+        top = top_n(scores, n, self.min_score)
+        return [(int(self.movie_ids[i]), float(scores[i])) for i in top]
+
+
+class NeighborIndexMixin:
+    """
+    "More like this" lookups for engines whose artifact carries a top-K
+    ``neighbor_indices`` / ``neighbor_scores`` table. Reads one row: O(K).
+    """
+    neighbor_indices = None
+    neighbor_scores = None
+
+    def similar_movies(self, movie_id, n=10):
+        """Up to ``n`` ``(movie_id, score)`` pairs most similar to ``movie_id``, best first"""
+        idx = self.movie_id_to_idx.get(movie_id)
+        if idx is None or self.neighbor_indices is None:
+            return []
+        neighbors = self.neighbor_indices[idx, :n]
+        scores = self.neighbor_scores[idx, :n]
+        return [(int(self.movie_ids[i]), float(score)) for i, score in zip(neighbors, scores) if score > 0]
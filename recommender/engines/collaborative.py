@@ -0,0 +1,73 @@
+"""
+User-user collaborative filtering over the sparse ``recommender_model.pkl``.
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .base import BaseRecommender, NeighborIndexMixin
+
+DEFAULT_NEIGHBORS = 50
+
+
+class UserUserRecommender(BaseRecommender):
+    name = 'collaborative'
+    min_score = 0
+
+    def __init__(self, model):
+        super().__init__(model, model['movies_list'])
+        self.matrix = csr_matrix(model['user_item_matrix'], dtype=np.float32)
+        row_norms = model.get('row_norms')
+        if row_norms is None:
+            row_norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1))).ravel()
+        self.row_norms = np.asarray(row_norms, dtype=np.float32)
+        self.user_id_to_idx = model.get('user_id_to_idx', {})
+
+    def score(self, user_id, ratings, k=DEFAULT_NEIGHBORS, **kwargs):
+        idx, values = self.rated_vector(ratings)
+        if not len(idx):
+            return None
+
+        user_vector = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        user_vector[idx] = values
+
+        denominator = self.row_norms * np.linalg.norm(values)
+        similarities = np.divide(
+            self.matrix.dot(user_vector), denominator,
+            out=np.zeros(self.matrix.shape[0], dtype=np.float32), where=denominator > 0
+        )
+        # The user's own training row would otherwise be its nearest neighbour
+        self_idx = self.user_id_to_idx.get(user_id)
+        if self_idx is not None:
+            similarities[self_idx] = 0
+
+        # Partial selection of the k nearest neighbours, then one mat-vec over their rows
+        k = min(k, len(similarities))
+        neighbors = np.argpartition(-similarities, k - 1)[:k]
+        neighbors = neighbors[similarities[neighbors] > 0]
+        if not len(neighbors):
+            return None
+        return self.matrix[neighbors].T.dot(similarities[neighbors])
+
+
+class ItemItemRecommender(NeighborIndexMixin, BaseRecommender):
+    """
+    Item-based collaborative filtering over the precomputed top-K neighbour
+    index in ``item_similarity.pkl``. Scoring is a gather over the neighbours
+    of the movies the user rated, independent of the number of users.
+    """
+    name = 'collaborative_item'
+    min_score = 0
+
+    def __init__(self, model):
+        super().__init__(model, model['movie_ids'])
+        self.neighbor_indices = model['neighbor_indices']
+        self.neighbor_scores = model['neighbor_scores']
+
+    def score(self, user_id, ratings, **kwargs):
+        idx, values = self.rated_vector(ratings)
+        if not len(idx):
+            return None
+
+        neighbors = self.neighbor_indices[idx]
+        weights = self.neighbor_scores[idx] * values[:, None]
+        return np.bincount(neighbors.ravel(), weights=weights.ravel(), minlength=len(self.movie_ids))
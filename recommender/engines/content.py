@@ -0,0 +1,91 @@
+"""
+Content-based serving over ``content_model.pkl``.
+
+A user's profile is the rating-weighted sum of the TF-IDF rows of the movies
+they rated; every movie is scored with one sparse mat-vec of ``tfidf_matrix``
+against it. Profiles are kept in the Django cache together with the ratings
+they were built from and are updated by the difference when ratings change,
+instead of being summed again from scratch.
+"""
+import numpy as np
+from django.core.cache import cache
+from scipy.sparse import csr_matrix
+
+from .base import BaseRecommender, NeighborIndexMixin
+
+PROFILE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class ContentRecommender(NeighborIndexMixin, BaseRecommender):
+    name = 'content'
+    min_score = 0
+
+    def __init__(self, model):
+        super().__init__(model, model['movie_ids'])
+        self.tfidf_matrix = csr_matrix(model['tfidf_matrix'], dtype=np.float32)
+        self.neighbor_indices = model.get('neighbor_indices')
+        self.neighbor_scores = model.get('neighbor_scores')
+
+    def _cache_key(self, user_id):
+        return f'content_profile:{self.model_version}:{user_id}'
+
+    def _weighted_rows(self, ratings):
+        """Rating-weighted sum of the TF-IDF rows of ``{movie_id: weight}``"""
+        idx, values = self.rated_vector(ratings)
+        profile = np.zeros(self.tfidf_matrix.shape[1], dtype=np.float32)
+        if len(idx):
+            profile += self.tfidf_matrix[idx].T.dot(values)
+        return profile
+
+    def profile(self, user_id, ratings):
+        """
+        The user's profile vector for their current ``ratings``. A cached
+        profile is brought up to date with only the ratings that changed.
+        """
+        key = self._cache_key(user_id)
+        cached = cache.get(key)
+
+        if cached is None:
+            profile = self._weighted_rows(ratings)
+        else:
+            old = cached['ratings']
+            delta = {m: r - old.get(m, 0) for m, r in ratings.items() if old.get(m) != r}
+            delta.update({m: -r for m, r in old.items() if m not in ratings})
+            if not delta:
+                return cached['profile']
+            profile = cached['profile'] + self._weighted_rows(delta)
+
+        cache.set(key, {'ratings': dict(ratings), 'profile': profile}, PROFILE_CACHE_TIMEOUT)
+        return profile
+
+    def update_profile(self, user_id, movie_id, rating):
+        """Fold one new or changed rating into a cached profile, if there is one"""
+        key = self._cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            return
+
+        ratings = dict(cached['ratings'])
+        delta = rating - ratings.get(movie_id, 0)
+        ratings[movie_id] = rating
+        profile = cached['profile'] + self._weighted_rows({movie_id: delta})
+        cache.set(key, {'ratings': ratings, 'profile': profile}, PROFILE_CACHE_TIMEOUT)
+
+    def score(self, user_id, ratings, **kwargs):
+        if not ratings:
+            return None
+        profile = self.profile(user_id, ratings)
+        if not profile.any():
+            return None
+        return self.tfidf_matrix.dot(profile)
+
+    def score_items(self, user_id, ratings, movie_ids, **kwargs):
+        result = np.full(len(movie_ids), -np.inf, dtype=np.float32)
+        if not ratings:
+            return result
+        profile = self.profile(user_id, ratings)
+        positions = self.catalogue_positions(movie_ids)
+        known = positions >= 0
+        if profile.any():
+            result[known] = self.tfidf_matrix[positions[known]].dot(profile)
+        return result
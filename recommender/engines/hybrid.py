@@ -0,0 +1,182 @@
+"""
+Hybrid recommender driven by ``hybrid_config.pkl``.
+
+The component engines score the user concurrently. Each component's scores
+are min-max normalised over the movies the user has not rated and blended
+with the configured weights on the union of the components' catalogues.
+Components the user does not have enough ratings for are left out
+(``min_ratings_for_<component>``); if none can score the user, the first
+component in ``fallback_order`` that can is used on its own.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ..model_registry import registry as default_registry
+from .base import top_n
+from .collaborative import UserUserRecommender
+from .content import ContentRecommender
+from .neural import NeuralRecommender, PYTORCH_AVAILABLE
+from .svd import SVDRecommender
+
+COMPONENTS = {
+    'collaborative': UserUserRecommender,
+    'svd': SVDRecommender,
+    'content': ContentRecommender,
+}
+# The neural artifact can only be unpickled with PyTorch installed
+if PYTORCH_AVAILABLE:
+    COMPONENTS['neural'] = NeuralRecommender
+
+# NumPy/SciPy release the GIL in the heavy parts of every scorer
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hybrid')
+
+
+def min_max(scores):
+    """Scale the finite entries of ``scores`` into [0, 1]; the rest become 0"""
+    finite = np.isfinite(scores)
+    normalized = np.zeros(len(scores), dtype=np.float32)
+    if not finite.any():
+        return normalized
+    low, high = scores[finite].min(), scores[finite].max()
+    normalized[finite] = (scores[finite] - low) / (high - low) if high > low else 1
+    return normalized
+
+
+class HybridRecommender:
+    name = 'hybrid'
+    min_score = 0
+    model_version = None
+
+    def __init__(self, config, registry=None, components=COMPONENTS):
+        self.config = config
+        self.registry = registry or default_registry
+        self.components = components
+        self.weights = {
+            name: weight for name, weight in config.get('weights', {}).items()
+            if name in components and weight > 0
+        }
+        # (component versions, (union of movie ids, position of each component's movies in it))
+        self._alignment = (None, None)
+
+    def _engine(self, name):
+        return self.registry.get_engine(name, self.components[name])
+
+    def component_versions(self):
+        """``(component, model_version)`` of every component a blend can use, None when not loaded"""
+        names = set(self.weights) | {name for name in self.config.get('fallback_order', []) if name in self.components}
+        versions = []
+        for name in sorted(names):
+            engine = self._engine(name)
+            versions.append((name, engine.model_version if engine is not None else None))
+        return versions
+
+    def component_engines(self, n_ratings):
+        """Weighted components that are trained and whose min-ratings rule the user meets"""
+        engines = {}
+        for name in self.weights:
+            if n_ratings < self.config.get(f'min_ratings_for_{name}', 0):
+                continue
+            engine = self._engine(name)
+            if engine is not None:
+                engines[name] = engine
+        return engines
+
+    @staticmethod
+    def _score(engine, user_id, ratings, movie_ids, kwargs):
+        start = time.perf_counter()
+        if movie_ids is None:
+            scores = engine.score(user_id, ratings, **kwargs)
+            if scores is not None:
+                scores = np.array(scores, dtype=np.float32)
+                scores[engine.movie_indices(ratings)] = -np.inf
+        else:
+            scores = engine.score_items(user_id, ratings, movie_ids, **kwargs)
+            if not np.isfinite(scores).any():
+                scores = None
+        return scores, time.perf_counter() - start
+
+    def score_components(self, engines, user_id, ratings, timings=None, movie_ids=None, **kwargs):
+        """
+        ``{component: scores}`` for the components that could score the user,
+        over each component's own catalogue or aligned with ``movie_ids``.
+        """
+        futures = {
+            name: _executor.submit(self._score, engine, user_id, ratings, movie_ids, kwargs)
+            for name, engine in engines.items()
+        }
+        results = {}
+        for name, future in futures.items():
+            scores, elapsed = future.result()
+            if timings is not None:
+                timings[name] = round(elapsed * 1000, 2)
+            if scores is not None:
+                results[name] = scores
+        return results
+
+    def fallback(self, user_id, ratings, tried, timings=None, movie_ids=None, **kwargs):
+        for name in self.config.get('fallback_order', []):
+            if name not in self.components or name in tried:
+                continue
+            engine = self._engine(name)
+            if engine is None:
+                continue
+            results = self.score_components({name: engine}, user_id, ratings, timings, movie_ids, **kwargs)
+            if results:
+                return {name: engine}, results
+        return {}, {}
+
+    def _align(self, engines):
+        key = tuple((name, engines[name].model_version) for name in sorted(engines))
+        cached_key, alignment = self._alignment
+        if cached_key == key:
+            return alignment
+
+        movie_ids = np.unique(np.concatenate([engine.movie_ids for engine in engines.values()]))
+        positions = {name: np.searchsorted(movie_ids, engine.movie_ids) for name, engine in engines.items()}
+        alignment = (movie_ids, positions)
+        self._alignment = (key, alignment)
+        return alignment
+
+    def _component_results(self, user_id, ratings, timings, movie_ids, kwargs):
+        engines = self.component_engines(len(ratings))
+        results = self.score_components(engines, user_id, ratings, timings, movie_ids, **kwargs)
+        if not results:
+            engines, results = self.fallback(user_id, ratings, set(engines), timings, movie_ids, **kwargs)
+        return {name: engines[name] for name in results}, results
+
+    def _blend(self, results, length, positions=None):
+        total_weight = sum(self.weights.get(name, 1.0) for name in results)
+        blended = np.zeros(length, dtype=np.float32)
+        for name, scores in results.items():
+            weighted = self.weights.get(name, 1.0) / total_weight * min_max(scores)
+            if positions is None:
+                blended += weighted
+            else:
+                blended[positions[name]] += weighted
+        return blended
+
+    def score_items(self, user_id, ratings, movie_ids, timings=None, **kwargs):
+        """Blended scores aligned with ``movie_ids``, normalised over those movies only"""
+        _, results = self._component_results(user_id, ratings, timings, movie_ids, kwargs)
+        if not results:
+            return np.full(len(movie_ids), -np.inf, dtype=np.float32)
+        return self._blend(results, len(movie_ids))
+
+    def recommend(self, user_id, ratings, n=10, timings=None, **kwargs):
+        """
+        Top-N ``(movie_id, score)`` pairs with blended scores in [0, 1].
+        ``timings``, when given, is filled with each component's scoring time in ms.
+        """
+        engines, results = self._component_results(user_id, ratings, timings, None, kwargs)
+        if not results:
+            return []
+
+        movie_ids, positions = self._align(engines)
+        blended = self._blend(results, len(movie_ids), positions)
+
+        # Rated movies were masked in every component, so they blend to 0 and
+        # fall under min_score together with movies no component scored
+        top = top_n(blended, n, self.min_score)
+        return [(int(movie_ids[i]), float(blended[i])) for i in top]
@@ -0,0 +1,47 @@
+"""
+Top-K nearest-neighbour tables over item vectors.
+
+Similarities are computed one row block at a time so peak memory stays at
+``max_block_elements`` floats instead of a dense N x N matrix; only the K
+best neighbours of every item are kept, as compact int32/float32 arrays.
+"""
+import numpy as np
+from sklearn.preprocessing import normalize
+
+DEFAULT_TOP_K = 50
+# Upper bound on the dense (block x N) similarity slab held at once
+MAX_BLOCK_ELEMENTS = 16_000_000
+
+
+def top_k_similar(vectors, k=DEFAULT_TOP_K, max_block_elements=MAX_BLOCK_ELEMENTS):
+    """
+    Cosine top-K neighbours for every row of ``vectors`` (sparse or dense).
+
+    Returns ``(indices, scores)`` of shape (N, K), best first. An item is never
+    its own neighbour.
+    """
+    vectors = normalize(vectors, norm='l2', axis=1)
+    n_items = vectors.shape[0]
+    k = max(0, min(k, n_items - 1))
+
+    indices = np.zeros((n_items, k), dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+
+    block_size = max(1, max_block_elements // n_items)
+    for start in range(0, n_items, block_size):
+        end = min(start + block_size, n_items)
+        block = vectors[start:end] @ vectors.T
+        block = block.toarray() if hasattr(block, 'toarray') else np.asarray(block)
+        block = block.astype(np.float32, copy=False)
+        block[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+
+        indices[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+    return indices, scores
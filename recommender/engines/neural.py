@@ -0,0 +1,214 @@
+"""
+Neural collaborative filtering serving over ``neural_model.pkl``.
+
+The network is rebuilt from the saved state dict once per loaded version and
+kept in eval mode; scoring runs under ``torch.inference_mode()``. The first
+MLP layer acts on the concatenated user and movie embeddings, so its movie
+half is precomputed for the whole catalogue at load time and a request only
+adds the user half and runs the remaining (small) layers, for all or only
+the candidate movies in one batched forward pass.
+
+With ``NEURAL_MICRO_BATCH_MS`` set, concurrent requests of a threaded worker
+are coalesced into a single forward pass (see ``MicroBatcher``).
+
+Users who were not in the training set have no embedding and are not scored.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+from .base import BaseRecommender
+
+try:
+    import torch
+    from torch import nn
+    PYTORCH_AVAILABLE = True
+except ImportError:
+    PYTORCH_AVAILABLE = False
+
+# (user, movie) pairs scored per coalesced forward pass at most
+MICRO_BATCH_MAX_ROWS = 65536
+# The batching thread exits after this long without requests and restarts on demand
+MICRO_BATCH_IDLE_SECONDS = 60
+
+
+if PYTORCH_AVAILABLE:
+    class NeuralCollaborativeFiltering(nn.Module):
+        """Neural Collaborative Filtering Model"""
+        def __init__(self, num_users, num_movies, embedding_dim=50, hidden_layers=[64, 32, 16]):
+            super(NeuralCollaborativeFiltering, self).__init__()
+
+            # Embeddings
+            self.user_embedding = nn.Embedding(num_users, embedding_dim)
+            self.movie_embedding = nn.Embedding(num_movies, embedding_dim)
+
+            # MLP layers
+            layers = []
+            input_dim = embedding_dim * 2
+
+            for hidden_dim in hidden_layers:
+                layers.append(nn.Linear(input_dim, hidden_dim))
+                layers.append(nn.ReLU())
+                layers.append(nn.Dropout(0.2))
+                input_dim = hidden_dim
+
+            layers.append(nn.Linear(input_dim, 1))
+            self.mlp = nn.Sequential(*layers)
+
+        @classmethod
+        def from_state_dict(cls, state_dict):
+            """Rebuild the network with the layer sizes recorded in a saved state dict"""
+            num_users, embedding_dim = state_dict['user_embedding.weight'].shape
+            num_movies = state_dict['movie_embedding.weight'].shape[0]
+            linear = sorted(
+                (key for key in state_dict if key.startswith('mlp.') and key.endswith('.weight')),
+                key=lambda key: int(key.split('.')[1]),
+            )
+            hidden_layers = [state_dict[key].shape[0] for key in linear[:-1]]
+
+            model = cls(num_users, num_movies, embedding_dim, hidden_layers)
+            model.load_state_dict(state_dict)
+            return model
+
+        def forward(self, user_ids, movie_ids):
+            user_emb = self.user_embedding(user_ids)
+            movie_emb = self.movie_embedding(movie_ids)
+
+            # Concatenate embeddings
+            x = torch.cat([user_emb, movie_emb], dim=1)
+
+            # Pass through MLP
+            output = self.mlp(x)
+            return output.squeeze(-1)
+
+
+class MicroBatcher:
+    """
+    Coalesces ``score_batch(user_indices, movie_indices)`` calls from
+    concurrent threads. The first call of a batch waits up to ``max_wait_ms``
+    for others to join, then one call scores them all and every caller gets
+    its own slice of the result.
+    """
+
+    def __init__(self, score_batch, max_wait_ms, max_rows=MICRO_BATCH_MAX_ROWS):
+        self.score_batch = score_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, user_idx, movie_idx):
+        future = Future()
+        with self._lock:
+            self._queue.put((user_idx, movie_idx, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='neural-batcher', daemon=True)
+                self._thread.start()
+        return future.result()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=MICRO_BATCH_IDLE_SECONDS)]
+        except queue.Empty:
+            return None
+
+        rows = len(batch[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                with self._lock:
+                    if self._queue.empty():
+                        # Let an engine that was swapped out be garbage collected
+                        self._thread = None
+                        return
+                continue
+
+            users, movies, futures = zip(*batch)
+            try:
+                results = self.score_batch(users, movies)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, scores in zip(futures, results):
+                future.set_result(scores)
+
+
+class NeuralRecommender(BaseRecommender):
+    name = 'neural'
+
+    def __init__(self, model):
+        movie_ids = np.empty(len(model['movie_map']), dtype=np.int64)
+        for movie_id, idx in model['movie_map'].items():
+            movie_ids[idx] = movie_id
+        super().__init__(model, movie_ids)
+        self.user_map = model['user_map']
+
+        self.network = NeuralCollaborativeFiltering.from_state_dict(model['model_state_dict'])
+        self.network.eval()
+
+        first = self.network.mlp[0]
+        dim = self.network.user_embedding.embedding_dim
+        with torch.inference_mode():
+            self._user_weight = first.weight[:, :dim]
+            self._bias = first.bias
+            self._movie_hidden = self.network.movie_embedding.weight @ first.weight[:, dim:].T
+        # Activation, dropout (a no-op in eval mode) and the remaining layers
+        self._head = self.network.mlp[1:]
+        self._all_movies = torch.arange(len(movie_ids))
+
+        wait_ms = getattr(settings, 'NEURAL_MICRO_BATCH_MS', 0)
+        self.batcher = MicroBatcher(self.score_batch, wait_ms) if wait_ms > 0 else None
+
+    def score_batch(self, user_indices, movie_indices):
+        """
+        Predicted ratings (1-5) of each user index for the movie index tensor
+        given with it, all in one forward pass.
+        """
+        counts = [len(movies) for movies in movie_indices]
+        with torch.inference_mode():
+            user_hidden = self.network.user_embedding(torch.as_tensor(user_indices)) @ self._user_weight.T + self._bias
+            hidden = self._movie_hidden[torch.cat(movie_indices)] + user_hidden.repeat_interleave(torch.as_tensor(counts), dim=0)
+            scores = self._head(hidden).reshape(-1).numpy() * 4 + 1
+        return np.split(scores, np.cumsum(counts)[:-1])
+
+    def _score(self, user_idx, movie_idx):
+        if self.batcher is not None:
+            return self.batcher.submit(user_idx, movie_idx)
+        return self.score_batch([user_idx], [movie_idx])[0]
+
+    def score(self, user_id, ratings, **kwargs):
+        user_idx = self.user_map.get(user_id)
+        if user_idx is None:
+            return None
+        return self._score(user_idx, self._all_movies)
+
+    def score_items(self, user_id, ratings, movie_ids, **kwargs):
+        result = np.full(len(movie_ids), -np.inf, dtype=np.float32)
+        user_idx = self.user_map.get(user_id)
+        if user_idx is None:
+            return result
+        positions = self.catalogue_positions(movie_ids)
+        known = positions >= 0
+        if known.any():
+            result[known] = self._score(user_idx, torch.from_numpy(positions[known]))
+        return result
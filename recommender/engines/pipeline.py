@@ -0,0 +1,257 @@
+"""
+Two-stage recommendation: candidate retrieval, then ranking.
+
+Cheap generators each propose up to their budget of unrated movies (item-item
+neighbours of the latest ratings, the SVD ANN index, the most rated movies
+and the most rated movies of the user's favourite genres). Only that pool of a few hundred candidates is then
+scored by the ranker, any engine with ``score_items``, instead of the full
+catalogue.
+
+Each stage has a budget: generators are capped in candidates, the pool is
+capped at ``max_candidates``, and once retrieval has used up
+``retrieval_budget_ms`` the remaining generators are skipped. Loading a
+model on a cold worker (``CandidateGenerator.prepare``) is not counted
+against that budget.
+"""
+import time
+from itertools import chain, zip_longest
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+
+from ..model_registry import registry as default_registry
+from ..models import Movie
+from .ann import DEFAULT_N_PROBE, MIN_ITEMS
+from .base import top_n
+from .collaborative import ItemItemRecommender
+from .svd import SVDRecommender
+
+# Candidates requested from each generator
+CANDIDATE_BUDGETS = {
+    'item_neighbors': 200,
+    'svd': 200,
+    'popular': 100,
+    'genre': 100,
+}
+MAX_CANDIDATES = 500
+RETRIEVAL_BUDGET_MS = 50
+
+# Latest ratings whose neighbours seed the item-item generator
+RECENT_RATINGS = 20
+FAVORITE_GENRES = 3
+# Popular and per-genre movie lists are shared by all users for this long; they
+# count every rating, so they are not recomputed often
+MOVIE_LIST_CACHE_TIMEOUT = 60 * 60
+
+
+class UserContext:
+    """What the generators and the ranker know about the user"""
+
+    def __init__(self, user_id, ratings, favorite_genres=()):
+        self.user_id = user_id
+        # {movie_id: rating}, newest rating first
+        self.ratings = ratings
+        self.favorite_genres = list(favorite_genres)
+
+    @property
+    def recent_movie_ids(self):
+        return list(self.ratings)[:RECENT_RATINGS]
+
+
+class CandidateGenerator:
+    name = None
+
+    def __init__(self, registry=None):
+        self.registry = registry or default_registry
+
+    def prepare(self):
+        """
+        Load whatever the generator reads (its engine), outside the retrieval
+        budget. The result is passed to ``candidates`` as ``engine``.
+        """
+
+    def candidates(self, context, budget, engine=None, **options):
+        """Up to ``budget`` unrated movie ids, most promising first"""
+        raise NotImplementedError
+
+
+class ItemNeighborCandidates(CandidateGenerator):
+    """Movies most similar to the ones the user rated last, weighted by rating"""
+    name = 'item_neighbors'
+
+    def prepare(self):
+        return self.registry.get_engine('collaborative_item', ItemItemRecommender)
+
+    def candidates(self, context, budget, engine=None, **options):
+        if engine is None:
+            return []
+        recent = {m: context.ratings[m] for m in context.recent_movie_ids}
+        idx, values = engine.rated_vector(recent)
+        if not len(idx):
+            return []
+
+        neighbors = engine.neighbor_indices[idx].ravel()
+        weights = (engine.neighbor_scores[idx] * values[:, None]).ravel()
+        unique, inverse = np.unique(neighbors, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        scores[np.isin(unique, engine.movie_indices(context.ratings))] = 0
+        return engine.movie_ids[unique[top_n(scores, budget, 0)]].tolist()
+
+
+class SVDCandidates(CandidateGenerator):
+    """
+    Nearest unrated movie factors to the user's factor vector. Like
+    ``SVDRecommender.recommend``, the ANN index is only searched for large
+    catalogues unless the request sets ``n_probe`` (0 forces exact scoring).
+    """
+    name = 'svd'
+
+    def prepare(self):
+        return self.registry.get_engine('svd', SVDRecommender)
+
+    def candidates(self, context, budget, engine=None, n_probe=None, **options):
+        if engine is None:
+            return []
+        user_vector = engine.user_vector(context.user_id, context.ratings)
+        if user_vector is None:
+            return []
+
+        rated = engine.movie_indices(context.ratings)
+        if n_probe is None:
+            n_probe = DEFAULT_N_PROBE if len(engine.movie_ids) >= MIN_ITEMS else 0
+        if engine.ann is not None and n_probe > 0:
+            idx, _ = engine.ann.search(user_vector, budget, n_probe, exclude=rated)
+        else:
+            scores = engine.movie_factors @ user_vector
+            scores[rated] = -np.inf
+            idx = top_n(scores, budget)
+        return engine.movie_ids[idx].tolist()
+
+
+def _most_rated(movies):
+    """
+    ``movies`` ordered by their number of ratings. Loaders leave the implicit
+    view and watchlist counts at 0, so those only break ties.
+    """
+    return (
+        movies.annotate(n_ratings=Count('ratings'))
+        .order_by('-n_ratings', '-view_count', '-watchlist_count', 'movie_id')
+    )
+
+
+def _cached_movie_ids(key, queryset, limit):
+    return cache.get_or_set(
+        key, lambda: list(queryset.values_list('movie_id', flat=True)[:limit]), MOVIE_LIST_CACHE_TIMEOUT
+    )
+
+
+class PopularCandidates(CandidateGenerator):
+    """Most rated movies overall"""
+    name = 'popular'
+
+    def candidates(self, context, budget, engine=None, **options):
+        movie_ids = _cached_movie_ids('pipeline:popular', _most_rated(Movie.objects.all()), MAX_CANDIDATES)
+        return [movie_id for movie_id in movie_ids if movie_id not in context.ratings][:budget]
+
+
+class GenreCandidates(CandidateGenerator):
+    """Most rated movies of the user's favourite genres, interleaved"""
+    name = 'genre'
+
+    def candidates(self, context, budget, engine=None, **options):
+        genres = context.favorite_genres[:FAVORITE_GENRES]
+        if not genres:
+            return []
+        per_genre = [
+            _cached_movie_ids(
+                f'pipeline:genre:{genre}',
+                _most_rated(Movie.objects.filter(genres__icontains=genre)),
+                MAX_CANDIDATES,
+            )
+            for genre in genres
+        ]
+        interleaved = chain.from_iterable(zip_longest(*per_genre))
+        return [
+            movie_id for movie_id in interleaved
+            if movie_id is not None and movie_id not in context.ratings
+        ][:budget]
+
+
+class RecommendationPipeline:
+    def __init__(self, generators, budgets=CANDIDATE_BUDGETS, max_candidates=MAX_CANDIDATES,
+                 retrieval_budget_ms=RETRIEVAL_BUDGET_MS):
+        self.generators = generators
+        self.budgets = budgets
+        self.max_candidates = max_candidates
+        self.retrieval_budget_ms = retrieval_budget_ms
+
+    def model_versions(self):
+        """``(generator, model_version)`` of the generators that read an engine"""
+        versions = []
+        for generator in self.generators:
+            engine = generator.prepare()
+            if engine is not None:
+                versions.append((generator.name, engine.model_version))
+        return versions
+
+    def candidates(self, context, times=None, **options):
+        """
+        De-duplicated unrated candidate movie ids from the generators, in
+        generator order. ``options`` (e.g. ``n_probe``) go to every generator.
+        """
+        spent = 0.0
+        pool = {}
+        for generator in self.generators:
+            if spent * 1000 > self.retrieval_budget_ms or len(pool) >= self.max_candidates:
+                break
+            engine = generator.prepare()
+            generator_start = time.perf_counter()
+            budget = self.budgets.get(generator.name, 100)
+            for movie_id in generator.candidates(context, budget, engine=engine, **options):
+                if movie_id not in context.ratings:
+                    pool.setdefault(movie_id, None)
+            elapsed = time.perf_counter() - generator_start
+            spent += elapsed
+            if times is not None:
+                times[generator.name] = round(elapsed * 1000, 2)
+        return list(pool)[:self.max_candidates]
+
+    def recommend(self, ranker, context, n=10, stats=None, **kwargs):
+        """
+        Top-N ``(movie_id, score)`` pairs among the candidates, ranked by
+        ``ranker``. ``stats``, when given, receives the candidate count and
+        the time spent per stage and per generator / ranker component in ms.
+        """
+        generator_times, component_times = {}, {}
+        start = time.perf_counter()
+        candidates = self.candidates(context, generator_times, n_probe=kwargs.get('n_probe'))
+        retrieval_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        recommended = []
+        if candidates:
+            scores = ranker.score_items(context.user_id, context.ratings, candidates, timings=component_times, **kwargs)
+            top = top_n(scores, n, ranker.min_score)
+            recommended = [(candidates[i], float(scores[i])) for i in top]
+        ranking_time = time.perf_counter() - start
+
+        if stats is not None:
+            stats.update({
+                'candidates': len(candidates),
+                'retrieval_ms': round(retrieval_time * 1000, 2),
+                'ranking_ms': round(ranking_time * 1000, 2),
+                'generator_times_ms': generator_times,
+            })
+            if component_times:
+                stats['component_times_ms'] = component_times
+        return recommended
+
+
+def default_pipeline(registry=None):
+    return RecommendationPipeline([
+        ItemNeighborCandidates(registry),
+        SVDCandidates(registry),
+        PopularCandidates(registry),
+        GenreCandidates(registry),
+    ])
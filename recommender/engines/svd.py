@@ -0,0 +1,106 @@
+"""
+Matrix factorisation serving over ``svd_model.pkl``.
+
+A user is scored with a single mat-vec of their factor vector against the
+float32 ``movie_factors``. Users who were not in the training set are folded
+in from their current ratings, so they are served without a retrain.
+
+Large catalogues are searched through the IVF index stored with the model
+instead of scoring every movie. Offline, ``recommend_batch`` scores blocks
+of training users with one matrix product each.
+"""
+import numpy as np
+
+from .ann import IVFIndex, DEFAULT_N_PROBE, MIN_ITEMS
+from .base import BaseRecommender
+
+# Users scored per matrix product in recommend_batch; bounds the block to
+# BATCH_BLOCK_SIZE x catalogue float32 scores
+BATCH_BLOCK_SIZE = 256
+
+
+class SVDRecommender(BaseRecommender):
+    name = 'svd'
+
+    def __init__(self, model):
+        super().__init__(model, model['movie_ids'])
+        self.movie_factors = np.ascontiguousarray(model['movie_factors'], dtype=np.float32)
+        self.user_factors = np.asarray(model['user_factors'], dtype=np.float32)
+        self.user_id_to_idx = {int(user_id): idx for idx, user_id in enumerate(model['user_ids'])}
+        self.ann = IVFIndex(model['ann_index']) if model.get('ann_index') else None
+
+    def fold_in(self, ratings):
+        """
+        Factor vector of a user from their ratings. TruncatedSVD projects a
+        row onto the item factors, so this is the ratings times the factor
+        rows of the movies they rated (unrated movies count as 0, as in training).
+        """
+        idx, values = self.rated_vector(ratings)
+        if not len(idx):
+            return None
+        return values @ self.movie_factors[idx]
+
+    def user_vector(self, user_id, ratings):
+        idx = self.user_id_to_idx.get(user_id)
+        if idx is not None:
+            return self.user_factors[idx]
+        return self.fold_in(ratings)
+
+    def score(self, user_id, ratings, **kwargs):
+        user_vector = self.user_vector(user_id, ratings)
+        if user_vector is None:
+            return None
+        return self.movie_factors @ user_vector
+
+    def score_items(self, user_id, ratings, movie_ids, **kwargs):
+        result = np.full(len(movie_ids), -np.inf, dtype=np.float32)
+        user_vector = self.user_vector(user_id, ratings)
+        if user_vector is not None:
+            positions = self.catalogue_positions(movie_ids)
+            known = positions >= 0
+            result[known] = self.movie_factors[positions[known]] @ user_vector
+        return result
+
+    def recommend(self, user_id, ratings, n=10, n_probe=None, **kwargs):
+        """
+        ``n_probe`` sets how many index lists are searched; 0 forces exact
+        scoring. By default the index is only used for large catalogues.
+        """
+        if n_probe is None:
+            n_probe = DEFAULT_N_PROBE if len(self.movie_ids) >= MIN_ITEMS else 0
+        if self.ann is None or n_probe == 0:
+            return super().recommend(user_id, ratings, n=n)
+
+        user_vector = self.user_vector(user_id, ratings)
+        if user_vector is None:
+            return []
+        idx, scores = self.ann.search(user_vector, n, n_probe, exclude=self.movie_indices(ratings))
+        return [(int(self.movie_ids[i]), float(score)) for i, score in zip(idx, scores)]
+
+    def recommend_batch(self, user_ids, rated, n=10, block_size=BATCH_BLOCK_SIZE):
+        """
+        ``{user_id: [(movie_id, score), ...]}`` top-N lists for the training
+        users among ``user_ids``; ``rated`` maps a user id to the movie ids
+        to leave out.
+        """
+        user_ids = [user_id for user_id in user_ids if user_id in self.user_id_to_idx]
+        n = min(n, len(self.movie_ids))
+        results = {}
+        for start in range(0, len(user_ids), block_size):
+            block = user_ids[start:start + block_size]
+            scores = self.user_factors[[self.user_id_to_idx[user_id] for user_id in block]] @ self.movie_factors.T
+            for row, user_id in enumerate(block):
+                scores[row, self.movie_indices(rated.get(user_id, ()))] = -np.inf
+
+            top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            for row, user_id in enumerate(block):
+                keep = np.isfinite(top_scores[row])
+                results[user_id] = list(zip(
+                    self.movie_ids[top[row, keep]].tolist(), top_scores[row, keep].tolist()
+                ))
+        return results
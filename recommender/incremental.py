@@ -0,0 +1,138 @@
+"""
+Incremental model updates between two full retrains.
+
+Users with new ratings are folded into the published SVD model against its
+fixed movie factors, and their rows of the user-item rating matrix are
+rewritten. Both artifacts are then published again, which gives them a new
+version: workers reload them and everything keyed on the model version
+(recommendation cache, hybrid alignment) turns over. Movie factors, the
+neighbour indexes and the catalogue only change with a full retrain.
+"""
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from .engines.svd import SVDRecommender
+from .model_registry import publish_if_current, registry
+from .models import Rating
+
+logger = logging.getLogger(__name__)
+
+# Keeps ``__in`` lookups under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 900
+
+
+def current_ratings(user_ids):
+    """``{user_id: {movie_id: rating}}`` with every current rating of the given users"""
+    user_ids = list(user_ids)
+    ratings = {user_id: {} for user_id in user_ids}
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        rows = (
+            Rating.objects
+            .filter(user_id__in=user_ids[start:start + LOOKUP_CHUNK_SIZE])
+            .values_list('user_id', 'movie__movie_id', 'rating')
+        )
+        for user_id, movie_id, rating in rows:
+            ratings[user_id][movie_id] = rating
+    return ratings
+
+
+def update_svd(loaded, ratings_by_user):
+    """
+    Copy of the SVD artifact with the users' factor rows re-fitted.
+
+    TruncatedSVD's movie factors are orthonormal, so the least-squares fit of
+    a zero-filled rating row against them is its projection, exactly what
+    ``SVDRecommender.fold_in`` computes. New users get a row appended.
+    """
+    engine = registry.get_engine('svd', SVDRecommender)
+    model = dict(loaded.data)
+    user_ids = list(model['user_ids'])
+    user_factors = np.array(model['user_factors'], dtype=np.float32)
+
+    new_rows = []
+    for user_id, ratings in ratings_by_user.items():
+        vector = engine.fold_in(ratings)
+        if vector is None:
+            continue
+        idx = engine.user_id_to_idx.get(user_id)
+        if idx is None:
+            user_ids.append(user_id)
+            new_rows.append(vector)
+        else:
+            user_factors[idx] = vector
+    if new_rows:
+        user_factors = np.vstack([user_factors, np.asarray(new_rows, dtype=np.float32)])
+
+    model.update({'user_ids': user_ids, 'user_factors': user_factors})
+    return model
+
+
+def update_collaborative(loaded, ratings_by_user):
+    """Copy of the user-user artifact with the users' rows replaced by their current ratings"""
+    model = dict(loaded.data)
+    matrix = csr_matrix(model['user_item_matrix'], copy=True)
+    movie_id_to_idx = model['movie_id_to_idx']
+    user_ids = list(model['user_ids'])
+    user_id_to_idx = dict(model['user_id_to_idx'])
+
+    rows, cols, values = [], [], []
+    for user_id, ratings in ratings_by_user.items():
+        idx = user_id_to_idx.get(user_id)
+        if idx is None:
+            idx = user_id_to_idx[user_id] = len(user_ids)
+            user_ids.append(user_id)
+        for movie_id, rating in ratings.items():
+            col = movie_id_to_idx.get(movie_id)
+            if col is not None:
+                rows.append(idx)
+                cols.append(col)
+                values.append(rating)
+
+    shape = (len(user_ids), matrix.shape[1])
+    matrix.resize(shape)
+    # Zero the users' old rows, then add their current ones
+    keep = np.ones(shape[0], dtype=matrix.dtype)
+    keep[[user_id_to_idx[user_id] for user_id in ratings_by_user]] = 0
+    matrix = (diags(keep) @ matrix + csr_matrix((values, (rows, cols)), shape=shape, dtype=matrix.dtype)).tocsr()
+    matrix.eliminate_zeros()
+
+    model.update({
+        'user_item_matrix': matrix,
+        'row_norms': np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel().astype(np.float32),
+        'user_ids': user_ids,
+        'user_id_to_idx': user_id_to_idx,
+    })
+    return model
+
+
+UPDATERS = {
+    'svd': update_svd,
+    'collaborative': update_collaborative,
+}
+
+
+def apply_rating_updates(user_ids):
+    """
+    Fold the current ratings of ``user_ids`` into every trained model in
+    ``UPDATERS`` and publish them. Returns False, leaving the models alone,
+    when one of them was replaced (e.g. by a full retrain or a concurrent
+    update) while updating.
+    """
+    ratings_by_user = current_ratings(user_ids)
+
+    updated = {}
+    for name, update in UPDATERS.items():
+        # Always build on the latest publish, e.g. the previous batch's
+        loaded = registry.get_loaded(name, refresh=True)
+        if loaded is None:
+            continue
+        updated[name] = (loaded, update(loaded, ratings_by_user))
+
+    if not updated:
+        return True
+    if not publish_if_current(updated, registry):
+        return False
+    logger.info(f"Folded {len(ratings_by_user)} users into {', '.join(updated)}")
+    return True
@@ -0,0 +1,275 @@
+"""
+Bulk ingest of MovieLens ratings.
+
+Dataset files are read from local disk in chunks so memory stays bounded
+for any dataset size. Rows are handled as NumPy columns: dataset ids are
+resolved to primary keys with one lookup per table, users are created with
+``bulk_create`` and ratings are written with batched raw INSERTs (or streamed
+through PostgreSQL ``COPY`` when ``USE_POSTGRES`` is on). Both paths store
+the dataset time of each rating, which ``auto_now_add`` would replace with
+the insert time. Callers wrap the calls in a transaction.
+"""
+import csv
+import io
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+
+from .models import Movie, Rating
+
+BATCH_SIZE = 10000
+# Keeps ``__in`` lookups under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 900
+DEFAULT_PASSWORD = 'password123'
+DEFAULT_CHUNK_SIZE = 100000
+
+RATING_COLUMNS = ['user_id', 'movie_id', 'rating', 'timestamp']
+
+# File layouts of the supported MovieLens variants
+DATASETS = {
+    'ml-100k': {
+        'movies': 'u.item',
+        'ratings': 'u.data',
+        'sep': '\t',
+        'header': None,
+        'encoding': 'latin-1',
+    },
+    'ml-1m': {
+        'movies': 'movies.dat',
+        'ratings': 'ratings.dat',
+        'sep': '::',
+        'header': None,
+        'encoding': 'latin-1',
+    },
+    'ml-25m': {
+        'movies': 'movies.csv',
+        'ratings': 'ratings.csv',
+        'sep': ',',
+        'header': 0,
+        'encoding': 'utf-8',
+    },
+}
+
+ML_100K_GENRES = ['unknown', 'Action', 'Adventure', 'Animation',
+                  'Children', 'Comedy', 'Crime', 'Documentary', 'Drama',
+                  'Fantasy', 'Film-Noir', 'Horror', 'Musical', 'Mystery',
+                  'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_movies(dataset, path):
+    """List of ``{'movie_id', 'title', 'genres'}`` dicts for a MovieLens variant"""
+    spec = DATASETS[dataset]
+    movies_file = os.path.join(path, spec['movies'])
+
+    if dataset == 'ml-100k':
+        movies_data = []
+        with open(movies_file, 'r', encoding=spec['encoding']) as f:
+            for line in f:
+                parts = line.strip().split('|')
+                if len(parts) >= 2:
+                    # The last 19 columns are genre indicators
+                    genres_list = [
+                        ML_100K_GENRES[i] for i, flag in enumerate(parts[5:24])
+                        if flag == '1' and i < len(ML_100K_GENRES)
+                    ]
+                    genres = '|'.join(genres_list) if genres_list else 'Unknown'
+                    movies_data.append({'movie_id': int(parts[0]), 'title': parts[1], 'genres': genres})
+        return movies_data
+
+    movies_df = pd.read_csv(
+        movies_file,
+        sep=spec['sep'],
+        header=spec['header'],
+        names=['movie_id', 'title', 'genres'],
+        encoding=spec['encoding'],
+        engine='python' if len(spec['sep']) > 1 else 'c',
+    )
+    return [
+        {'movie_id': int(movie_id), 'title': title, 'genres': genres}
+        for movie_id, title, genres in movies_df.itertuples(index=False)
+    ]
+
+
+def iter_rating_chunks(dataset, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield ``user_id, movie_id, rating, timestamp`` frames of at most
+    ``chunk_size`` rows. Half-star ratings (ml-25m) are rounded half up
+    into the 1-5 integer scale of the Rating model (0.5 -> 1, 4.5 -> 5).
+    """
+    spec = DATASETS[dataset]
+    reader = pd.read_csv(
+        os.path.join(path, spec['ratings']),
+        sep=spec['sep'],
+        header=spec['header'],
+        names=RATING_COLUMNS,
+        encoding=spec['encoding'],
+        engine='python' if len(spec['sep']) > 1 else 'c',
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        chunk['rating'] = np.clip(np.floor(chunk['rating'].to_numpy() + 0.5), 1, 5).astype(np.int64)
+        yield chunk
+
+
+def limit_ratings(chunks, max_users=None, max_ratings=None):
+    """
+    Apply a user cap (first ``max_users`` distinct users in file order) and
+    a total rating cap to a stream of rating chunks.
+    """
+    kept_users = set()
+    remaining = max_ratings
+
+    for chunk in chunks:
+        if max_users:
+            if len(kept_users) < max_users:
+                new_users = [u for u in pd.unique(chunk['user_id']) if u not in kept_users]
+                kept_users.update(new_users[:max_users - len(kept_users)])
+            chunk = chunk[chunk['user_id'].isin(kept_users)]
+        if remaining is not None:
+            chunk = chunk.iloc[:remaining]
+            remaining -= len(chunk)
+        if len(chunk):
+            yield chunk
+        if remaining is not None and remaining <= 0:
+            return
+
+
+def movie_pk_map():
+    """{MovieLens movie id: Movie primary key}"""
+    return dict(Movie.objects.values_list('movie_id', 'id'))
+
+
+def ensure_users(dataset_user_ids, password=DEFAULT_PASSWORD):
+    """
+    Create the ``user<id>`` accounts that do not exist yet and return
+    {dataset user id: User primary key}. The password is hashed once and
+    shared by every new sample account.
+    """
+    usernames = {f'user{user_id}': int(user_id) for user_id in dataset_user_ids}
+    names = list(usernames)
+
+    existing = {}
+    for chunk in _chunks(names, LOOKUP_CHUNK_SIZE):
+        existing.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+
+    missing = [name for name in names if name not in existing]
+    if missing:
+        password_hash = make_password(password)
+        User.objects.bulk_create(
+            [User(username=name, password=password_hash) for name in missing],
+            batch_size=BATCH_SIZE,
+        )
+        for chunk in _chunks(missing, LOOKUP_CHUNK_SIZE):
+            existing.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+
+    return {usernames[name]: pk for name, pk in existing.items()}
+
+
+def insert_ratings(user_pks, movie_pks, ratings, timestamps=None, batch_size=BATCH_SIZE):
+    """
+    Insert aligned arrays of user pk, movie pk, rating (and optional Unix
+    timestamps) and return the number of rows written.
+    """
+    if not len(ratings):
+        return 0
+    if getattr(settings, 'USE_POSTGRES', False) and connection.vendor == 'postgresql':
+        return _copy_ratings(user_pks, movie_pks, ratings, timestamps)
+    return _insert_ratings(user_pks, movie_pks, ratings, timestamps, batch_size)
+
+
+# Rating columns written by both insert paths, in row order
+RATING_FIELDS = ('user', 'movie', 'rating', 'timestamp', 'updated_at', 'review_text', 'recommended_by_algorithm')
+
+
+def _rating_rows(user_pks, movie_pks, ratings, timestamps=None):
+    """
+    Raw rating rows in ``RATING_FIELDS`` order. A dataset rating was last
+    updated when it was made, so ``updated_at`` is its timestamp too; without
+    timestamps both are the insert time.
+    """
+    if timestamps is None:
+        created = [datetime.now(timezone.utc)] * len(ratings)
+    else:
+        created = [datetime.fromtimestamp(ts, timezone.utc) for ts in timestamps.tolist()]
+    for user_pk, movie_pk, rating, ts in zip(user_pks.tolist(), movie_pks.tolist(), ratings.tolist(), created):
+        yield user_pk, movie_pk, rating, ts, ts, '', ''
+
+
+def _rating_columns():
+    opts = Rating._meta
+    return opts.db_table, [opts.get_field(name).column for name in RATING_FIELDS]
+
+
+def _insert_ratings(user_pks, movie_pks, ratings, timestamps=None, batch_size=BATCH_SIZE):
+    """Write rows with batched INSERTs, bypassing ``auto_now_add`` so the dataset time is kept"""
+    table, columns = _rating_columns()
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(table)} ({', '.join(quote(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    rows = [
+        (user_pk, movie_pk, rating, adapt(ts), adapt(updated), review, algorithm)
+        for user_pk, movie_pk, rating, ts, updated, review, algorithm
+        in _rating_rows(user_pks, movie_pks, ratings, timestamps)
+    ]
+    with connection.cursor() as cursor:
+        for batch in _chunks(rows, batch_size):
+            cursor.executemany(sql, batch)
+    return len(ratings)
+
+
+def _copy_ratings(user_pks, movie_pks, ratings, timestamps=None):
+    """Stream rows into the rating table with PostgreSQL COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_pk, movie_pk, rating, ts, updated, review, algorithm in _rating_rows(
+        user_pks, movie_pks, ratings, timestamps
+    ):
+        writer.writerow((user_pk, movie_pk, rating, ts.isoformat(), updated.isoformat(), review, algorithm))
+    buffer.seek(0)
+
+    table, columns = _rating_columns()
+    # Empty CSV fields would otherwise be read as NULL for the two text columns
+    sql = (
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN "
+        f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(columns[-2:])}))"
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+    return len(ratings)
+
+
+def ingest_ratings(ratings_df, movie_pks_by_id, batch_size=BATCH_SIZE):
+    """
+    Create the users of a ``user_id, movie_id, rating, timestamp`` frame and
+    insert its ratings. Rows for unknown movies are skipped.
+    """
+    user_ids = ratings_df['user_id'].to_numpy()
+    user_pks_by_id = ensure_users(np.unique(user_ids))
+
+    movie_pks = ratings_df['movie_id'].map(movie_pks_by_id).to_numpy(dtype=np.float64)
+    known = ~np.isnan(movie_pks)
+
+    user_pks = np.fromiter((user_pks_by_id[u] for u in user_ids[known].tolist()), dtype=np.int64)
+    timestamps = ratings_df['timestamp'].to_numpy()[known] if 'timestamp' in ratings_df else None
+
+    return insert_ratings(
+        user_pks,
+        movie_pks[known].astype(np.int64),
+        ratings_df['rating'].to_numpy()[known].astype(np.int64),
+        timestamps,
+        batch_size=batch_size,
+    )
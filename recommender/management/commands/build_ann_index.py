@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from recommender.model_registry import registry, save_artifact
+from recommender.engines.ann import build_ivf_index, benchmark, IVFIndex
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the approximate nearest-neighbour index of the SVD model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['svd'], default='svd',
+                            help='Model whose movie vectors are indexed')
+        parser.add_argument('--lists', type=int, default=None,
+                            help='Number of k-means lists (default: 4 * sqrt(movies))')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Compare recall and latency against exact brute-force top-N')
+        parser.add_argument('--n', type=int, default=10,
+                            help='N used for recall@N in the benchmark')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of sampled benchmark queries')
+
+    def handle(self, *args, **options):
+        name = options['model']
+        model_data = registry.get(name)
+        if model_data is None:
+            raise CommandError(f"No trained '{name}' model found. Train it first.")
+        # A copy: the registry's dict backs the engine this process serves
+        model_data = dict(model_data)
+
+        self.stdout.write(self.style.SUCCESS('='*70))
+        self.stdout.write(self.style.SUCCESS(f'ANN INDEX: {name.upper()}'))
+        self.stdout.write(self.style.SUCCESS('='*70))
+
+        vectors, queries = self.vectors_and_queries(model_data, options['queries'])
+
+        self.stdout.write(f'\n[1/2] Building index over {len(vectors)} movies...')
+        start = time.perf_counter()
+        model_data['ann_index'] = build_ivf_index(vectors, n_lists=options['lists'], metric='ip')
+        elapsed = time.perf_counter() - start
+        index = IVFIndex(model_data['ann_index'])
+        self.stdout.write(f'✓ {index.n_lists} lists built in {elapsed:.2f}s')
+
+        path = save_artifact(name, model_data)
+        self.stdout.write(self.style.SUCCESS(f'✓ Index saved with the model to {path}'))
+
+        if options['benchmark']:
+            self.stdout.write(f'\n[2/2] Benchmarking {len(queries)} queries (recall@{options["n"]})...')
+            self.stdout.write(f'  {"n_probe":>8} {"recall":>8} {"ms/query":>10} {"exact ms":>10}')
+            for row in benchmark(index, vectors, queries, n=options['n']):
+                self.stdout.write(
+                    f'  {row["n_probe"]:>8} {row["recall"]:>8.3f} '
+                    f'{row["ms_per_query"]:>10.3f} {row["exact_ms_per_query"]:>10.3f}'
+                )
+
+        self.stdout.write(self.style.SUCCESS('\n✓ ANN index complete!\n'))
+
+    def vectors_and_queries(self, model_data, n_queries):
+        """Indexed movie factors and sample user factor vectors to query them with"""
+        rng = np.random.default_rng(42)
+        vectors = np.asarray(model_data['movie_factors'], dtype=np.float32)
+        # Queries are user factor vectors, scored by inner product
+        users = np.asarray(model_data['user_factors'], dtype=np.float32)
+        queries = users[rng.choice(len(users), min(n_queries, len(users)), replace=False)]
+        return vectors, queries
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from recommender.training_data import export_snapshot, TrainingSnapshot
+import os
+
+
+class Command(BaseCommand):
+    help = 'Export ratings, interactions and movie metadata into a training snapshot'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Exporting training snapshot...')
+        snapshot_id = export_snapshot()
+
+        snapshot = TrainingSnapshot(snapshot_id)
+        self.stdout.write(f'✓ Ratings: {len(snapshot.ratings())}')
+        self.stdout.write(f'✓ Interactions: {len(snapshot.interactions())}')
+        self.stdout.write(f'✓ Movies: {len(snapshot.movies())}')
+        self.stdout.write(f'✓ Size: {os.path.getsize(snapshot.path) / (1024 * 1024):.1f} MB')
+        self.stdout.write(self.style.SUCCESS(f'✓ Snapshot {snapshot_id} saved to {snapshot.path}'))
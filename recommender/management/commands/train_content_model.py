@@ -1,21 +1,32 @@
 from django.core.management.base import BaseCommand
-from recommender.models import Movie
+from recommender.training_data import get_movies
+from recommender.model_registry import save_artifact
+from recommender.engines.neighbors import top_k_similar, DEFAULT_TOP_K
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import pickle
-import os
+import numpy as np
+import time
 
 
 class Command(BaseCommand):
     help = 'Train Content-Based Filtering model using movie metadata'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', default=None,
+                            help='Train from an exported snapshot (id or path) instead of the database')
+        parser.add_argument('--output-dir', default=None,
+                            help='Stage the artifact in this directory instead of publishing it')
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help='Most similar movies kept per movie')
+
+    def handle(self, *args, **options):
+        self.output_dir = options['output_dir']
+        self.top_k = options['top_k']
         self.stdout.write(self.style.SUCCESS('=' * 70))
         self.stdout.write(self.style.SUCCESS('CONTENT-BASED FILTERING TRAINING'))
         self.stdout.write(self.style.SUCCESS('=' * 70))
 
         self.stdout.write('\n[1/2] Extracting movie features...')
-        movies_data = self.extract_features()
+        movies_data = self.extract_features(options['snapshot'])
 
         if not movies_data:
             self.stdout.write(self.style.ERROR("No movies found. Cannot train model."))
@@ -26,19 +37,14 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS('\n✓ Content-based model training complete!\n'))
 
-    def extract_features(self):
+    def extract_features(self, snapshot=None):
         """Extract textual features from movies"""
-        movies = Movie.objects.all()
+        movies = get_movies(snapshot)
 
         movies_data = []
-        for movie in movies:
-
-            # Handle null or missing text fields
-            genres = movie.genres or ""
-            director = movie.director or ""
-            cast = movie.cast or ""
-            plot = movie.plot or ""
-
+        for movie_id, title, genres, director, cast, plot in zip(
+            movies.movie_ids.tolist(), movies.title, movies.genres, movies.director, movies.cast, movies.plot
+        ):
             # Build feature text
             features = f"{genres} {director} {cast} {plot}".strip()
 
@@ -47,8 +53,8 @@ class Command(BaseCommand):
                 features = "unknown movie metadata"
 
             movies_data.append({
-                'movie_id': movie.movie_id,
-                'title': movie.title or "",
+                'movie_id': movie_id,
+                'title': title,
                 'features': features,
                 'genres': genres,
             })
@@ -57,7 +63,7 @@ class Command(BaseCommand):
         return movies_data
 
     def train_model(self, movies_data):
-        """Train TF-IDF and calculate similarity"""
+        """Train TF-IDF and index the most similar movies"""
 
         # Extract feature list
         features_list = [movie['features'] for movie in movies_data]
@@ -82,24 +88,26 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("Your movie metadata fields may be too empty."))
             return
 
-        # Cosine similarity
-        cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
+        # Top-K cosine neighbours, computed block by block instead of a dense N x N matrix
+        start = time.perf_counter()
+        neighbor_indices, neighbor_scores = top_k_similar(tfidf_matrix, k=self.top_k)
+        elapsed = time.perf_counter() - start
 
         self.stdout.write(f'✓ TF-IDF matrix shape: {tfidf_matrix.shape}')
-        self.stdout.write(f'✓ Similarity matrix shape: {cosine_sim.shape}')
+        self.stdout.write(f'✓ Neighbours per movie: {neighbor_indices.shape[1]} (built in {elapsed:.2f}s, '
+                          f'{(neighbor_indices.nbytes + neighbor_scores.nbytes) / (1024 * 1024):.1f} MB)')
 
         # Save model
-        os.makedirs('ml_models', exist_ok=True)
         model_data = {
             'tfidf': tfidf,
-            'tfidf_matrix': tfidf_matrix,
-            'cosine_sim': cosine_sim,
+            'tfidf_matrix': tfidf_matrix.astype(np.float32),
+            'neighbor_indices': neighbor_indices,
+            'neighbor_scores': neighbor_scores,
             'movie_ids': [m['movie_id'] for m in movies_data],
             'movie_titles': [m['title'] for m in movies_data],
             'movie_id_to_idx': {m['movie_id']: idx for idx, m in enumerate(movies_data)},
         }
 
-        with open('ml_models/content_model.pkl', 'wb') as f:
-            pickle.dump(model_data, f)
+        path = save_artifact('content', model_data, model_dir=self.output_dir)
 
-        self.stdout.write(self.style.SUCCESS('✓ Content model saved to ml_models/content_model.pkl'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Content model saved to {path}'))
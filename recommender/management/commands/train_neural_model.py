@@ -1,73 +1,68 @@
 from django.core.management.base import BaseCommand
-from recommender.models import Movie, Rating
+from recommender.training_data import get_ratings
+from recommender.model_registry import MODEL_DIR, registry, save_artifact
 import numpy as np
-import pandas as pd
-import pickle
 import os
+import time
 
 # Try to import PyTorch
 try:
     import torch
     import torch.nn as nn
     import torch.optim as optim
-    from torch.utils.data import Dataset, DataLoader
+    from recommender.engines.neural import NeuralCollaborativeFiltering
     PYTORCH_AVAILABLE = True
 except ImportError:
     PYTORCH_AVAILABLE = False
 
 
-class MovieRatingDataset(Dataset):
-    """PyTorch Dataset for movie ratings"""
-    def __init__(self, user_ids, movie_ids, ratings):
-        self.user_ids = torch.LongTensor(user_ids)
-        self.movie_ids = torch.LongTensor(movie_ids)
-        self.ratings = torch.FloatTensor(ratings)
-    
-    def __len__(self):
-        return len(self.ratings)
-    
-    def __getitem__(self, idx):
-        return self.user_ids[idx], self.movie_ids[idx], self.ratings[idx]
+# Upper bound; training normally stops earlier on the validation RMSE
+DEFAULT_EPOCHS = 30
+# Validated against the former batches of 128 at lr 0.001: same validation RMSE on
+# MovieLens 100k in about a third of the time (see the README)
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_LR = 0.003
+DEFAULT_PATIENCE = 3
+DEFAULT_VALIDATION_FRACTION = 0.1
+# Smaller validation RMSE changes do not count as an improvement
+MIN_IMPROVEMENT = 1e-4
+EVALUATION_BATCH_SIZE = 65536
 
-
-class NeuralCollaborativeFiltering(nn.Module):
-    """Neural Collaborative Filtering Model"""
-    def __init__(self, num_users, num_movies, embedding_dim=50, hidden_layers=[64, 32, 16]):
-        super(NeuralCollaborativeFiltering, self).__init__()
-        
-        # Embeddings
-        self.user_embedding = nn.Embedding(num_users, embedding_dim)
-        self.movie_embedding = nn.Embedding(num_movies, embedding_dim)
-        
-        # MLP layers
-        layers = []
-        input_dim = embedding_dim * 2
-        
-        for hidden_dim in hidden_layers:
-            layers.append(nn.Linear(input_dim, hidden_dim))
-            layers.append(nn.ReLU())
-            layers.append(nn.Dropout(0.2))
-            input_dim = hidden_dim
-        
-        layers.append(nn.Linear(input_dim, 1))
-        self.mlp = nn.Sequential(*layers)
-    
-    def forward(self, user_ids, movie_ids):
-        user_emb = self.user_embedding(user_ids)
-        movie_emb = self.movie_embedding(movie_ids)
-        
-        # Concatenate embeddings
-        x = torch.cat([user_emb, movie_emb], dim=1)
-        
-        # Pass through MLP
-        output = self.mlp(x)
-        return output.squeeze()
+CHECKPOINT_DIR = os.path.join(MODEL_DIR, 'checkpoints')
+CHECKPOINT_FILE = 'neural_checkpoint.pt'
 
 
 class Command(BaseCommand):
     help = 'Train Neural Collaborative Filtering model using PyTorch'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', default=None,
+                            help='Train from an exported snapshot (id or path) instead of the database')
+        parser.add_argument('--output-dir', default=None,
+                            help='Stage the artifact in this directory instead of publishing it')
+        parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS,
+                            help='Maximum passes over the training ratings')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Ratings per optimizer step')
+        parser.add_argument('--lr', type=float, default=DEFAULT_LR,
+                            help='Adam learning rate')
+        parser.add_argument('--threads', type=int, default=None,
+                            help='CPU threads used by PyTorch (default: PyTorch decides)')
+        parser.add_argument('--validation-fraction', type=float, default=DEFAULT_VALIDATION_FRACTION,
+                            help='Latest share of the ratings held out for validation (0 disables early stopping)')
+        parser.add_argument('--patience', type=int, default=DEFAULT_PATIENCE,
+                            help='Epochs without a better validation RMSE before training stops')
+        parser.add_argument('--checkpoint-every', type=int, default=1,
+                            help='Save a checkpoint every N epochs (0 disables checkpoints)')
+        parser.add_argument('--checkpoint-dir', default=None,
+                            help=f'Checkpoint directory (default: the output dir, else {CHECKPOINT_DIR})')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue from the checkpoint of an interrupted run on the same data')
+        parser.add_argument('--warm-start', action='store_true',
+                            help='Start from the weights of the published neural model for the users and movies it knows')
+
+    def handle(self, *args, **options):
+        self.output_dir = options['output_dir']
         if not PYTORCH_AVAILABLE:
             self.stdout.write(self.style.WARNING('PyTorch not installed. Install with: pip install torch'))
             self.stdout.write(self.style.WARNING('Skipping neural model training...'))
@@ -76,98 +71,262 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('='*70))
         self.stdout.write(self.style.SUCCESS('NEURAL COLLABORATIVE FILTERING TRAINING'))
         self.stdout.write(self.style.SUCCESS('='*70))
+
+        if options['threads']:
+            torch.set_num_threads(options['threads'])
         
         # Prepare data
         self.stdout.write('\n[1/3] Preparing training data...')
-        train_loader, user_map, movie_map, num_users, num_movies = self.prepare_data()
+        train, validation, user_map, movie_map = self.prepare_data(options['snapshot'], options['validation_fraction'])
+        
+        checkpoint_dir = options['checkpoint_dir'] or self.output_dir or CHECKPOINT_DIR
+        self.checkpoint_path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
         
         # Train model
         self.stdout.write('\n[2/3] Training neural network...')
-        model = self.train_model(train_loader, num_users, num_movies)
+        model = NeuralCollaborativeFiltering(len(user_map), len(movie_map))
+        previous = registry.get('neural') if options['warm_start'] else None
+        if options['warm_start'] and not (previous is not None and self.warm_start(model, previous, user_map, movie_map)):
+            self.stdout.write(self.style.WARNING('  No compatible published neural model, training from scratch'))
+            previous = None
+        
+        start = time.perf_counter()
+        progress = self.train_model(
+            model, train, validation,
+            epochs=options['epochs'], batch_size=options['batch_size'], lr=options['lr'],
+            patience=options['patience'], checkpoint_every=options['checkpoint_every'],
+            resume=options['resume'],
+        )
+        training_stats = self.training_stats(previous, time.perf_counter() - start, progress)
         
         # Save model
         self.stdout.write('\n[3/3] Saving model...')
-        self.save_model(model, user_map, movie_map)
+        self.save_model(model, user_map, movie_map, training_stats)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
         
         self.stdout.write(self.style.SUCCESS('\n✅ Neural model training complete!\n'))
     
-    def prepare_data(self):
-        """Prepare data for neural network training"""
-        ratings = Rating.objects.select_related('user', 'movie').all()
-        
-        user_ids = []
-        movie_ids = []
-        rating_values = []
-        
-        for rating in ratings:
-            user_ids.append(rating.user.id)
-            movie_ids.append(rating.movie.movie_id)
-            rating_values.append(rating.rating)
-        
-        # Create mappings
-        unique_users = list(set(user_ids))
-        unique_movies = list(set(movie_ids))
+    def prepare_data(self, snapshot=None, validation_fraction=DEFAULT_VALIDATION_FRACTION):
+        """Training and validation tensors plus the user / movie index maps"""
+        ratings = get_ratings(snapshot)
         
-        user_map = {user_id: idx for idx, user_id in enumerate(unique_users)}
-        movie_map = {movie_id: idx for idx, movie_id in enumerate(unique_movies)}
+        # Create mappings and map to indices in one pass
+        unique_users, user_indices = np.unique(ratings.user_ids, return_inverse=True)
+        unique_movies, movie_indices = np.unique(ratings.movie_ids, return_inverse=True)
         
-        # Map to indices
-        user_indices = [user_map[uid] for uid in user_ids]
-        movie_indices = [movie_map[mid] for mid in movie_ids]
+        user_map = {int(user_id): idx for idx, user_id in enumerate(unique_users)}
+        movie_map = {int(movie_id): idx for idx, movie_id in enumerate(unique_movies)}
         
         # Normalize ratings to 0-1
-        ratings_normalized = [(r - 1) / 4 for r in rating_values]
+        ratings_normalized = (ratings.ratings - 1) / 4
         
-        # Create dataset and dataloader
-        dataset = MovieRatingDataset(user_indices, movie_indices, ratings_normalized)
-        train_loader = DataLoader(dataset, batch_size=128, shuffle=True)
+        # Whole-dataset tensors; batches are sliced from them directly
+        samples = (
+            torch.from_numpy(user_indices.astype(np.int64)),
+            torch.from_numpy(movie_indices.astype(np.int64)),
+            torch.from_numpy(ratings_normalized.astype(np.float32)),
+        )
+        train, validation = self.split_by_time(samples, ratings.timestamps, validation_fraction)
         
         self.stdout.write(f'✓ Users: {len(unique_users)}')
         self.stdout.write(f'✓ Movies: {len(unique_movies)}')
-        self.stdout.write(f'✓ Ratings: {len(rating_values)}')
+        self.stdout.write(f'✓ Ratings: {len(ratings)}')
+        if validation is not None:
+            self.stdout.write(f'✓ Validation: latest {len(validation[2])} ratings')
+        else:
+            self.stdout.write('✓ Validation: none, training for the full number of epochs')
         
-        return train_loader, user_map, movie_map, len(unique_users), len(unique_movies)
+        return train, validation, user_map, movie_map
     
-    def train_model(self, train_loader, num_users, num_movies, epochs=10):
-        """Train the neural network"""
+    def split_by_time(self, samples, timestamps, fraction):
+        """
+        Hold out the most recent ``fraction`` of the ratings, as the model
+        will be judged on future ratings. Split by rank, so ratings sharing a
+        timestamp do not shrink or grow the validation set.
+        """
+        n_held_out = int(np.ceil(fraction * len(timestamps)))
+        if n_held_out <= 0 or n_held_out >= len(timestamps):
+            return samples, None
+        order = torch.from_numpy(np.argsort(timestamps, kind='stable'))
+        train, validation = order[:-n_held_out], order[-n_held_out:]
+        return tuple(t[train] for t in samples), tuple(t[validation] for t in samples)
+    
+    def train_epoch(self, model, optimizer, criterion, samples, batch_size):
+        """One pass over shuffled slices of the sample tensors; returns the mean loss"""
+        users, movies, ratings = samples
+        n_samples = len(ratings)
+        model.train()
+        total_loss = 0.0
         
-        model = NeuralCollaborativeFiltering(num_users, num_movies)
+        # One permutation per epoch instead of per-item sampling and collation
+        permutation = torch.randperm(n_samples)
+        for begin in range(0, n_samples, batch_size):
+            batch = permutation[begin:begin + batch_size]
+            optimizer.zero_grad()
+            
+            predictions = model(users[batch], movies[batch])
+            loss = criterion(predictions, ratings[batch])
+            
+            loss.backward()
+            optimizer.step()
+            
+            total_loss += loss.item() * len(batch)
+        
+        return total_loss / n_samples
+    
+    def evaluate(self, model, samples):
+        """RMSE on the 1-5 rating scale"""
+        users, movies, ratings = samples
+        model.eval()
+        squared_error = 0.0
+        with torch.no_grad():
+            for begin in range(0, len(ratings), EVALUATION_BATCH_SIZE):
+                end = begin + EVALUATION_BATCH_SIZE
+                errors = model(users[begin:end], movies[begin:end]) - ratings[begin:end]
+                squared_error += float((errors ** 2).sum())
+        return float(np.sqrt(squared_error / len(ratings))) * 4
+    
+    def warm_start(self, model, previous, user_map, movie_map):
+        """
+        Copy the previous model's MLP and the embeddings of the users and
+        movies it knew into ``model``; rows of new ids keep their random
+        init. Returns False when the architectures differ.
+        """
+        state = previous['model_state_dict']
+        mlp_state = {key[len('mlp.'):]: value for key, value in state.items() if key.startswith('mlp.')}
+        if state['user_embedding.weight'].shape[1] != model.user_embedding.embedding_dim:
+            return False
+        try:
+            model.mlp.load_state_dict(mlp_state)
+        except RuntimeError:
+            return False
+        
+        with torch.no_grad():
+            for name, ids, previous_ids in (
+                ('user_embedding', user_map, previous['user_map']),
+                ('movie_embedding', movie_map, previous['movie_map']),
+            ):
+                pairs = [(idx, previous_ids[key]) for key, idx in ids.items() if key in previous_ids]
+                if pairs:
+                    new_rows, old_rows = (torch.tensor(rows) for rows in zip(*pairs))
+                    getattr(model, name).weight[new_rows] = state[f'{name}.weight'][old_rows]
+                label = name.split('_')[0]
+                self.stdout.write(f'  Warm start: {len(pairs)}/{len(ids)} {label}s reuse their embedding')
+        return True
+    
+    def train_model(self, model, train, validation, epochs=DEFAULT_EPOCHS,
+                    batch_size=DEFAULT_BATCH_SIZE, lr=DEFAULT_LR, patience=DEFAULT_PATIENCE,
+                    checkpoint_every=1, resume=False):
+        """
+        Train until the validation RMSE stops improving for ``patience``
+        epochs (or for ``epochs`` without validation data) and leave the
+        model with its best validation weights. Returns the training progress.
+        """
+        n_samples = len(train[2])
+        num_users, num_movies = model.user_embedding.num_embeddings, model.movie_embedding.num_embeddings
         criterion = nn.MSELoss()
-        optimizer = optim.Adam(model.parameters(), lr=0.001)
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+        
+        # Identifies the training data a checkpoint belongs to
+        fingerprint = (n_samples, num_users, num_movies, round(float(train[2].sum()), 3))
+        progress = {'epoch': 0, 'best_rmse': float('inf'), 'best_epoch': 0, 'best_state': None}
+        if resume:
+            self.resume_from_checkpoint(model, optimizer, progress, fingerprint)
         
-        for epoch in range(epochs):
-            model.train()
-            total_loss = 0
+        for epoch in range(progress['epoch'], epochs):
+            start = time.perf_counter()
+            loss = self.train_epoch(model, optimizer, criterion, train, batch_size)
+            elapsed = time.perf_counter() - start
             
-            for user_batch, movie_batch, rating_batch in train_loader:
-                optimizer.zero_grad()
-                
-                predictions = model(user_batch, movie_batch)
-                loss = criterion(predictions, rating_batch)
-                
-                loss.backward()
-                optimizer.step()
-                
-                total_loss += loss.item()
+            line = f'  Epoch {epoch+1}/{epochs} - Loss: {loss:.4f}'
+            if validation is not None:
+                rmse = self.evaluate(model, validation)
+                line += f' - Val RMSE: {rmse:.4f}'
+                if rmse < progress['best_rmse'] - MIN_IMPROVEMENT:
+                    progress.update({
+                        'best_rmse': rmse,
+                        'best_epoch': epoch + 1,
+                        'best_state': {key: value.clone() for key, value in model.state_dict().items()},
+                    })
+            self.stdout.write(f'{line} - {n_samples / elapsed:,.0f} samples/s')
             
-            avg_loss = total_loss / len(train_loader)
-            self.stdout.write(f'  Epoch {epoch+1}/{epochs} - Loss: {avg_loss:.4f}')
+            progress['epoch'] = epoch + 1
+            if checkpoint_every and progress['epoch'] % checkpoint_every == 0:
+                self.save_checkpoint(model, optimizer, progress, fingerprint)
+            
+            if validation is not None and progress['epoch'] - progress['best_epoch'] >= patience:
+                self.stdout.write(f'✓ Early stopping: no improvement in {patience} epochs')
+                break
         
-        return model
+        if progress['best_state'] is not None:
+            model.load_state_dict(progress['best_state'])
+            self.stdout.write(f'✓ Best validation RMSE {progress["best_rmse"]:.4f} at epoch {progress["best_epoch"]}')
+        return progress
     
-    def save_model(self, model, user_map, movie_map):
-        """Save the trained model"""
-        os.makedirs('ml_models', exist_ok=True)
+    def training_stats(self, previous, elapsed, progress):
+        """
+        Time, epochs and best validation RMSE of this run. Warm starts carry
+        the numbers of the last cold start forward and report against them.
+        """
+        stats = {
+            'seconds': elapsed,
+            'epochs': progress['epoch'],
+            'best_epoch': progress['best_epoch'],
+            'best_rmse': progress['best_rmse'] if progress['best_state'] is not None else None,
+        }
+        self.stdout.write(f'✓ Trained {stats["epochs"]} epochs in {elapsed:.2f}s')
+        if previous is None:
+            return {'warm_start': False, **stats, 'cold_start': dict(stats)}
         
+        cold_start = (previous.get('training_stats') or {}).get('cold_start')
+        if cold_start:
+            self.stdout.write(
+                f'  Last cold start: {cold_start["epochs"]} epochs in {cold_start["seconds"]:.2f}s '
+                f'({cold_start["epochs"] - stats["epochs"]} epochs, {cold_start["seconds"] - elapsed:.2f}s saved)'
+            )
+            if stats['best_rmse'] is not None and cold_start.get('best_rmse') is not None:
+                self.stdout.write(
+                    f'  Best validation RMSE {stats["best_rmse"]:.4f} at epoch {stats["best_epoch"]} vs '
+                    f'{cold_start["best_rmse"]:.4f} at epoch {cold_start["best_epoch"]} for the last cold start'
+                )
+        return {'warm_start': True, **stats, 'cold_start': cold_start}
+    
+    def save_checkpoint(self, model, optimizer, progress, fingerprint):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp_path = f'{self.checkpoint_path}.tmp{os.getpid()}'
+        torch.save({
+            'fingerprint': fingerprint,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'progress': progress,
+        }, tmp_path)
+        os.replace(tmp_path, self.checkpoint_path)
+    
+    def resume_from_checkpoint(self, model, optimizer, progress, fingerprint):
+        if not os.path.exists(self.checkpoint_path):
+            self.stdout.write('  No checkpoint to resume from, starting from scratch')
+            return
+        checkpoint = torch.load(self.checkpoint_path)
+        if checkpoint['fingerprint'] != fingerprint:
+            self.stdout.write(self.style.WARNING('  Checkpoint was made on different data, starting from scratch'))
+            return
+        model.load_state_dict(checkpoint['model_state_dict'])
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        progress.update(checkpoint['progress'])
+        self.stdout.write(f'  Resumed from {self.checkpoint_path} after epoch {progress["epoch"]}')
+    
+    def save_model(self, model, user_map, movie_map, training_stats=None):
+        """Save the trained model"""
         model_data = {
             'model_state_dict': model.state_dict(),
             'user_map': user_map,
             'movie_map': movie_map,
             'num_users': len(user_map),
             'num_movies': len(movie_map),
+            'training_stats': training_stats,
         }
         
-        with open('ml_models/neural_model.pkl', 'wb') as f:
-            pickle.dump(model_data, f)
+        path = save_artifact('neural', model_data, model_dir=self.output_dir)
         
-        self.stdout.write(self.style.SUCCESS('✓ Neural model saved to ml_models/neural_model.pkl'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'✓ Neural model saved to {path}'))
\ No newline at end of file
@@ -1,130 +1,209 @@
 from django.core.management.base import BaseCommand
-from recommender.models import Movie, Rating, MovieInteraction
-import pandas as pd
+from recommender.training_data import get_ratings, get_interactions, index_of
+from recommender.model_registry import registry, save_artifact
+from recommender.engines.ann import build_ivf_index
 import numpy as np
 from sklearn.decomposition import TruncatedSVD
-from scipy.sparse import csr_matrix
-import pickle
-import os
+from scipy.sparse import coo_matrix
+import time
+
+# Warm-started subspace iteration stops once no singular value moves by more than this (relative);
+# starting from the previous factors that takes 2-3 iterations, TruncatedSVD runs 5 from random
+WARM_START_TOLERANCE = 1e-2
+WARM_START_MAX_ITERATIONS = 10
 
 
 class Command(BaseCommand):
     help = 'Train SVD Matrix Factorization model for better recommendations'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', default=None,
+                            help='Train from an exported snapshot (id or path) instead of the database')
+        parser.add_argument('--output-dir', default=None,
+                            help='Stage the artifact in this directory instead of publishing it')
+        parser.add_argument('--warm-start', action='store_true',
+                            help='Start from the movie factors of the published SVD model')
+
+    def handle(self, *args, **options):
+        self.output_dir = options['output_dir']
         self.stdout.write(self.style.SUCCESS('='*70))
         self.stdout.write(self.style.SUCCESS('SVD MATRIX FACTORIZATION TRAINING'))
         self.stdout.write(self.style.SUCCESS('='*70))
         
         # Prepare data
         self.stdout.write('\n[1/3] Preparing training data...')
-        ratings_df, implicit_df = self.prepare_data()
+        ratings, interactions = self.prepare_data(options['snapshot'])
         
         # Train SVD
         self.stdout.write('\n[2/3] Training SVD model...')
-        self.train_svd(ratings_df, implicit_df)
+        self.train_svd(ratings, interactions, options['warm_start'])
         
         # Summary
         self.stdout.write('\n[3/3] Training complete!')
         self.print_summary()
     
-    def prepare_data(self):
+    def prepare_data(self, snapshot=None):
         """Prepare explicit ratings and implicit feedback"""
         
         # Explicit ratings
-        ratings = Rating.objects.select_related('user', 'movie').all()   # FIXED
-        explicit_data = []
-        for rating in ratings:
-            explicit_data.append({
-                'user_id': rating.user.id,
-                'movie_id': rating.movie.movie_id,
-                'rating': rating.rating
-            })
-        
-        ratings_df = pd.DataFrame(explicit_data)
-        print("DEBUG RATING COLUMNS:", ratings_df.columns)
+        ratings = get_ratings(snapshot)
         
         # Implicit feedback (views, watchlist)
-        interactions = MovieInteraction.objects.select_related('user', 'movie').all()
-        implicit_data = []
-        for interaction in interactions:
-            weight = 0.5 if interaction.interaction_type == 'watchlist' else 0.3
-            implicit_data.append({
-                'user_id': interaction.user.id,
-                'movie_id': interaction.movie.movie_id,
-                'weight': weight
-            })
-        implicit_df = pd.DataFrame(implicit_data) if implicit_data else pd.DataFrame()
-        
-        self.stdout.write(f'✓ Explicit ratings: {len(ratings_df)}')
-        self.stdout.write(f'✓ Implicit interactions: {len(implicit_df)}')
-        
-        return ratings_df, implicit_df
+        interactions = get_interactions(snapshot)
+        
+        self.stdout.write(f'✓ Explicit ratings: {len(ratings)}')
+        self.stdout.write(f'✓ Implicit interactions: {len(interactions)}')
+        
+        return ratings, interactions
     
-    def train_svd(self, ratings_df, implicit_df):
+    def build_matrix(self, ratings, interactions):
+        """
+        Sparse users x movies matrix of ratings plus the mean implicit weight
+        of every (user, movie) pair, over the users and movies that have ratings.
+        """
+        user_ids = np.unique(ratings.user_ids)
+        movie_ids = np.unique(ratings.movie_ids)
+        shape = (len(user_ids), len(movie_ids))
+        
+        rows, _ = index_of(user_ids, ratings.user_ids)
+        cols, _ = index_of(movie_ids, ratings.movie_ids)
+        matrix = coo_matrix((ratings.ratings, (rows, cols)), shape=shape, dtype=np.float32).tocsr()
+        
+        if len(interactions):
+            rows, user_found = index_of(user_ids, interactions.user_ids)
+            cols, movie_found = index_of(movie_ids, interactions.movie_ids)
+            keep = user_found & movie_found
+            rows, cols = rows[keep], cols[keep]
+            
+            # Both matrices share the same coordinates, so their data arrays line up
+            weight_sums = coo_matrix((interactions.weights[keep], (rows, cols)), shape=shape, dtype=np.float32).tocsr()
+            counts = coo_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape).tocsr()
+            weight_sums.data /= counts.data
+            matrix = matrix + weight_sums
+        
+        return matrix, user_ids, movie_ids
+    
+    def train_svd(self, ratings, interactions, warm_start=False):
         """Train SVD with combined explicit and implicit feedback"""
-        
-        if ratings_df.empty:
+        if not len(ratings):
             self.stdout.write(self.style.ERROR("No ratings found. Cannot train SVD model."))
             return
         
-        # Create user-movie matrix
-        user_movie_matrix = ratings_df.pivot_table(
-            index='user_id',
-            columns='movie_id',
-            values='rating',
-            fill_value=0
-        )
-        
-        # Implicit feedback
-        if not implicit_df.empty:
-            implicit_matrix = implicit_df.pivot_table(
-                index='user_id',
-                columns='movie_id',
-                values='weight',
-                fill_value=0
-            )
-            implicit_matrix = implicit_matrix.reindex(
-                index=user_movie_matrix.index,
-                columns=user_movie_matrix.columns,
-                fill_value=0
-            )
-            user_movie_matrix = user_movie_matrix + implicit_matrix
+        user_movie_matrix, user_ids, movie_ids = self.build_matrix(ratings, interactions)
         
-        self.stdout.write(f'✓ User-Movie matrix shape: {user_movie_matrix.shape}')
+        self.stdout.write(f'✓ User-Movie matrix shape: {user_movie_matrix.shape} ({user_movie_matrix.nnz} entries)')
         
-        # Apply SVD
         n_components = min(50, min(user_movie_matrix.shape) - 1)
-        svd = TruncatedSVD(n_components=n_components, random_state=42)
-        
-        user_factors = svd.fit_transform(user_movie_matrix)
-        movie_factors = svd.components_.T
+        previous = registry.get('svd') if warm_start else None
+        if warm_start and previous is None:
+            self.stdout.write(self.style.WARNING('No published SVD model to warm-start from, training from scratch'))
+        
+        start = time.perf_counter()
+        if previous is not None:
+            # Subspace iteration from the previous factors
+            user_factors, movie_factors, iterations = self.warm_start_svd(
+                user_movie_matrix, movie_ids, previous, n_components
+            )
+            svd = None
+            variance_explained = self.explained_variance_ratio(user_movie_matrix, user_factors)
+        else:
+            # Apply SVD
+            svd = TruncatedSVD(n_components=n_components, random_state=42)
+            user_factors = svd.fit_transform(user_movie_matrix)
+            movie_factors = svd.components_.T
+            variance_explained = svd.explained_variance_ratio_.sum()
+            iterations = svd.n_iter
+        elapsed = time.perf_counter() - start
         
-        variance_explained = svd.explained_variance_ratio_.sum()
         self.stdout.write(f'✓ SVD components: {n_components}')
         self.stdout.write(f'✓ Variance explained: {variance_explained:.2%}')
+        training_stats = self.training_stats(previous, elapsed, iterations)
+        
+        movie_factors = movie_factors.astype(np.float32)
+        ann_index = build_ivf_index(movie_factors, metric='ip')
+        self.stdout.write(f'✓ ANN index: {len(ann_index["centroids"])} lists')
         
         # Save model
-        os.makedirs('ml_models', exist_ok=True)
         model_data = {
+            # sklearn estimator of a cold start; None when warm-started
             'svd': svd,
-            'user_factors': user_factors,
+            'user_factors': user_factors.astype(np.float32),
             'movie_factors': movie_factors,
-            'user_ids': user_movie_matrix.index.tolist(),
-            'movie_ids': user_movie_matrix.columns.tolist(),
+            'user_ids': user_ids.tolist(),
+            'movie_ids': movie_ids.tolist(),
             'n_components': n_components,
             'variance_explained': variance_explained,
+            'ann_index': ann_index,
+            'training_stats': training_stats,
         }
         
-        with open('ml_models/svd_model.pkl', 'wb') as f:
-            pickle.dump(model_data, f)
+        path = save_artifact('svd', model_data, model_dir=self.output_dir)
         
-        self.stdout.write(self.style.SUCCESS('✓ SVD model saved to ml_models/svd_model.pkl'))
+        self.stdout.write(self.style.SUCCESS(f'✓ SVD model saved to {path}'))
+    
+    def warm_start_svd(self, matrix, movie_ids, previous, n_components):
+        """
+        Top ``n_components`` singular vectors by subspace iteration, starting
+        from the previous movie factors. Movies the previous model did not
+        know (and missing components) start from random rows.
+        """
+        rng = np.random.default_rng(42)
+        initial = rng.standard_normal((len(movie_ids), n_components)) / np.sqrt(len(movie_ids))
+        
+        previous_factors = np.asarray(previous['movie_factors'])
+        positions, found = index_of(np.asarray(previous['movie_ids']), movie_ids)
+        k = min(n_components, previous_factors.shape[1])
+        initial[found, :k] = previous_factors[positions[found], :k]
+        
+        basis, _ = np.linalg.qr(initial)
+        singular_values = None
+        for iteration in range(1, WARM_START_MAX_ITERATIONS + 1):
+            projected = matrix @ basis
+            current = np.linalg.svd(projected, compute_uv=False)
+            converged = (
+                singular_values is not None
+                and np.max(np.abs(current - singular_values) / np.maximum(current, 1e-12)) < WARM_START_TOLERANCE
+            )
+            singular_values = current
+            if converged:
+                break
+            basis, _ = np.linalg.qr(matrix.T @ projected)
+        else:
+            projected = matrix @ basis
+        
+        # Rayleigh-Ritz: rotate the basis onto the singular vectors, as TruncatedSVD returns them
+        left, singular_values, right_t = np.linalg.svd(projected, full_matrices=False)
+        return left * singular_values, basis @ right_t.T, iteration
+    
+    def explained_variance_ratio(self, matrix, user_factors):
+        """Share of the matrix's column variance captured by the factors, as TruncatedSVD reports it"""
+        mean = np.asarray(matrix.mean(axis=0)).ravel()
+        mean_square = np.asarray(matrix.multiply(matrix).mean(axis=0)).ravel()
+        return float(user_factors.var(axis=0).sum() / (mean_square - mean ** 2).sum())
+    
+    def training_stats(self, previous, elapsed, iterations):
+        """
+        Time and iterations of this run. Warm starts carry the numbers of
+        the last cold start forward and report the time saved against it.
+        """
+        if previous is None:
+            self.stdout.write(f'✓ Decomposition time: {elapsed:.2f}s')
+            cold_start = {'seconds': elapsed, 'iterations': iterations}
+            return {'warm_start': False, 'seconds': elapsed, 'iterations': iterations, 'cold_start': cold_start}
+        
+        cold_start = (previous.get('training_stats') or {}).get('cold_start')
+        if cold_start:
+            self.stdout.write(
+                f'✓ Decomposition: {iterations} iterations in {elapsed:.2f}s vs {cold_start["iterations"]} '
+                f'in {cold_start["seconds"]:.2f}s for the last cold start ({cold_start["seconds"] - elapsed:.2f}s saved)'
+            )
+        else:
+            self.stdout.write(f'✓ Decomposition time: {elapsed:.2f}s')
+        return {'warm_start': True, 'seconds': elapsed, 'iterations': iterations, 'cold_start': cold_start}
     
     def print_summary(self):
         self.stdout.write('\n' + '='*70)
         self.stdout.write(self.style.SUCCESS('SVD MODEL TRAINING COMPLETE'))
         self.stdout.write('='*70)
-        self.stdout.write('✓ Model: ml_models/svd_model.pkl')
         self.stdout.write('✓ Ready for predictions!')
         self.stdout.write('='*70 + '\n')
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelupdatetask',
+            name='stage_durations',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
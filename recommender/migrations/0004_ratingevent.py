@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recommender', '0003_precomputedrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rating', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='recommender.rating')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_events', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,357 @@
+"""
+Process-resident registry for trained recommendation artifacts.
+
+Every gunicorn/celery worker unpickles an artifact the first time it is
+requested and keeps it in memory. Subsequent requests only ``stat()`` the
+file (at most once every ``CHECK_INTERVAL`` seconds) and reload it when its
+mtime/size changes, so a retrain is picked up without restarting workers.
+
+Which file backs each artifact is decided by ``MANIFEST``. A full retrain
+writes every artifact into its own release directory and then swaps the
+manifest in one ``os.replace``, so workers switch to the whole new set of
+models together. Without a manifest the artifacts are read from
+``MODEL_DIR`` directly.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import pickle
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = 'ml_models'
+
+ARTIFACTS = {
+    'collaborative': 'recommender_model.pkl',
+    'collaborative_item': 'item_similarity.pkl',
+    'svd': 'svd_model.pkl',
+    'content': 'content_model.pkl',
+    'neural': 'neural_model.pkl',
+    'hybrid': 'hybrid_config.pkl',
+}
+
+MANIFEST = 'manifest.json'
+# Older unreferenced releases are deleted when a new one is published
+RELEASES_TO_KEEP = 3
+
+# Seconds between two stat() calls for the same artifact
+CHECK_INTERVAL = 2.0
+
+
+def estimate_size(obj, _seen=None):
+    """Approximate in-memory footprint of a loaded artifact in bytes"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if sparse.issparse(obj):
+        return sum(
+            getattr(obj, attr).nbytes
+            for attr in ('data', 'indices', 'indptr', 'row', 'col')
+            if isinstance(getattr(obj, attr, None), np.ndarray)
+        )
+    if hasattr(obj, 'element_size') and hasattr(obj, 'nelement'):
+        # torch.Tensor
+        return obj.element_size() * obj.nelement()
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class LoadedModel:
+    """An artifact held in memory together with its load statistics"""
+
+    def __init__(self, name, path, data, version, load_time, memory_bytes):
+        self.name = name
+        self.path = path
+        self.data = data
+        self.version = version
+        self.load_time = load_time
+        self.memory_bytes = memory_bytes
+        # Serving engine built from ``data``; dropped together with it on reload
+        self.engine = None
+        self.loaded_at = time.time()
+        self.last_checked = time.monotonic()
+
+    @property
+    def version_tag(self):
+        return f'{self.version[0]}-{self.version[1]}'
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'version': self.version_tag,
+            'load_time_ms': round(self.load_time * 1000, 2),
+            'memory_mb': round(self.memory_bytes / (1024 * 1024), 2),
+            'loaded_at': self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """Loads each artifact once per process and hot-swaps it when the file changes"""
+
+    def __init__(self, model_dir=MODEL_DIR, check_interval=CHECK_INTERVAL):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self._models = {}
+        self._locks = {name: threading.Lock() for name in ARTIFACTS}
+        self._manifest = {}
+        self._manifest_version = None
+
+    def manifest(self):
+        """The published manifest, re-read only when the file changes"""
+        path = os.path.join(self.model_dir, MANIFEST)
+        version = _file_version(path)
+        if version != self._manifest_version:
+            self._manifest = read_manifest(self.model_dir)
+            self._manifest_version = version
+        return self._manifest
+
+    def version(self):
+        """Tag that changes whenever any artifact is published, None without a manifest"""
+        manifest = self.manifest()
+        if not manifest:
+            return None
+        return f"{manifest.get('release')}-{manifest.get('published_at')}"
+
+    def path(self, name):
+        published = self.manifest().get('artifacts', {}).get(name)
+        if published:
+            return os.path.join(self.model_dir, published)
+        return os.path.join(self.model_dir, ARTIFACTS[name])
+
+    def get(self, name):
+        """Return the artifact's data, or None if it has never been trained"""
+        loaded = self.get_loaded(name)
+        return loaded.data if loaded is not None else None
+
+    def get_loaded(self, name, refresh=False):
+        """The artifact's ``LoadedModel``; ``refresh`` checks the file now instead of trusting the last check"""
+        loaded = self._models.get(name)
+        if not refresh and loaded is not None and time.monotonic() - loaded.last_checked < self.check_interval:
+            return loaded
+
+        with self._locks[name]:
+            loaded = self._models.get(name)
+            path = self.path(name)
+            version = _file_version(path)
+
+            if version is None:
+                # Keep serving what we have if the file vanished mid-deploy
+                return loaded
+            if loaded is not None and loaded.path == path and loaded.version == version:
+                loaded.last_checked = time.monotonic()
+                return loaded
+
+            loaded = self._load(name, path, version)
+            self._models[name] = loaded
+            return loaded
+
+    def is_current(self, loaded):
+        """Whether ``loaded`` is still the published file, i.e. nobody replaced it since it was read"""
+        return self.path(loaded.name) == loaded.path and _file_version(loaded.path) == loaded.version
+
+    def get_engine(self, name, factory):
+        """
+        Return ``factory(data)`` built once per loaded version of the artifact.
+        The engine gets a ``model_version`` tag to key anything it caches on.
+        """
+        return self.engine_for(self.get_loaded(name), factory)
+
+    def engine_for(self, loaded, factory):
+        """``get_engine`` for a ``LoadedModel`` the caller already holds (None stays None)"""
+        if loaded is None:
+            return None
+        if loaded.engine is None:
+            engine = factory(loaded.data)
+            engine.model_version = loaded.version_tag
+            loaded.engine = engine
+        return loaded.engine
+
+    def _load(self, name, path, version):
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        load_time = time.perf_counter() - start
+
+        loaded = LoadedModel(name, path, data, version, load_time, estimate_size(data))
+        logger.info(
+            f"Loaded model '{name}' from {path} in {loaded.load_time * 1000:.1f}ms "
+            f"({loaded.memory_bytes / (1024 * 1024):.1f} MB)"
+        )
+        return loaded
+
+    def stats(self):
+        """Load time and memory footprint of every artifact currently in memory"""
+        return [self._models[name].as_dict() for name in ARTIFACTS if name in self._models]
+
+    def clear(self):
+        self._models = {}
+        self._manifest = {}
+        self._manifest_version = None
+
+
+registry = ModelRegistry()
+
+
+def get_model(name):
+    return registry.get(name)
+
+
+def read_manifest(model_dir=MODEL_DIR):
+    """``{'release': ..., 'published_at': ..., 'artifacts': {name: relative path}}``"""
+    try:
+        with open(os.path.join(model_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_temp(path, write):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    return tmp_path
+
+
+def _write_atomic(path, write):
+    os.replace(_write_temp(path, write), path)
+
+
+@contextmanager
+def manifest_lock(model_dir=MODEL_DIR):
+    """Serialise read-modify-write of the manifest across processes"""
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, f'{MANIFEST}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def save_artifact(name, data, model_dir=None):
+    """
+    Pickle an artifact atomically: write to a temp file in the same directory
+    and rename it over the old one, so a worker never unpickles a half-written file.
+
+    Without ``model_dir`` the artifact goes to ``MODEL_DIR`` and is published
+    right away; with it the artifact is only staged there until
+    ``publish_release()`` is called.
+    """
+    target_dir = model_dir or MODEL_DIR
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, ARTIFACTS[name])
+    _write_atomic(path, lambda f: pickle.dump(data, f))
+
+    if model_dir is None:
+        publish_artifacts({name: path})
+    return path
+
+
+def publish_artifacts(paths, release=None, model_dir=MODEL_DIR):
+    """
+    Point the manifest at ``{name: artifact path}`` in one atomic rename.
+    Artifacts not in ``paths`` keep their current entry.
+    """
+    with manifest_lock(model_dir):
+        return _write_manifest(paths, release, model_dir)
+
+
+def _write_manifest(paths, release, model_dir):
+    manifest = read_manifest(model_dir)
+    artifacts = manifest.get('artifacts', {})
+    artifacts.update({name: os.path.relpath(path, model_dir) for name, path in paths.items()})
+    manifest = {
+        'release': release or manifest.get('release'),
+        'published_at': time.time(),
+        'artifacts': artifacts,
+    }
+    _write_atomic(
+        os.path.join(model_dir, MANIFEST),
+        lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')),
+    )
+    return manifest
+
+
+def publish_if_current(updates, model_registry=None):
+    """
+    Publish new data for loaded artifacts, ``{name: (loaded model, data)}``,
+    unless one of them was replaced since it was loaded. The check and the
+    publish happen under the manifest lock, so two concurrent updates (or an
+    update and a full retrain) cannot overwrite each other. Returns whether
+    the artifacts were published.
+    """
+    model_registry = model_registry or registry
+    model_dir = model_registry.model_dir
+    os.makedirs(model_dir, exist_ok=True)
+    # Pickle outside the lock; only the renames and the check need it
+    staged = {
+        name: _write_temp(os.path.join(model_dir, ARTIFACTS[name]), lambda f, data=data: pickle.dump(data, f))
+        for name, (_, data) in updates.items()
+    }
+    try:
+        with manifest_lock(model_dir):
+            if not all(model_registry.is_current(loaded) for loaded, _ in updates.values()):
+                return False
+            paths = {}
+            for name, tmp_path in staged.items():
+                paths[name] = os.path.join(model_dir, ARTIFACTS[name])
+                os.replace(tmp_path, paths[name])
+            _write_manifest(paths, None, model_dir)
+            return True
+    finally:
+        for tmp_path in staged.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def release_dir(release, model_dir=MODEL_DIR):
+    """Directory a full retrain stages its artifacts in before publishing"""
+    return os.path.join(model_dir, 'releases', release)
+
+
+def publish_release(release, model_dir=MODEL_DIR):
+    """Publish every artifact staged in a release directory together"""
+    directory = release_dir(release, model_dir)
+    paths = {
+        name: os.path.join(directory, filename)
+        for name, filename in ARTIFACTS.items()
+        if os.path.exists(os.path.join(directory, filename))
+    }
+    manifest = publish_artifacts(paths, release=release, model_dir=model_dir)
+    _prune_releases(manifest, model_dir)
+    return manifest
+
+
+def _prune_releases(manifest, model_dir):
+    releases = os.path.join(model_dir, 'releases')
+    in_use = {path.split(os.sep)[1] for path in manifest['artifacts'].values() if path.startswith('releases' + os.sep)}
+    stale = [name for name in sorted(os.listdir(releases)) if name not in in_use]
+    for name in stale[:-RELEASES_TO_KEEP]:
+        shutil.rmtree(os.path.join(releases, name), ignore_errors=True)
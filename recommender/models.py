@@ -312,9 +312,46 @@ class ModelUpdateTask(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    # Seconds spent in each stage of a full retrain, e.g. {"snapshot": 4.2, "svd": 31.0}
+    stage_durations = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.task_type} - {self.status}"
+
+
+# -----------------------------------------------------------
+# PRECOMPUTED RECOMMENDATIONS
+# -----------------------------------------------------------
+
+class PrecomputedRecommendation(models.Model):
+    """Top-N list computed offline after a retrain, served as-is until the user rates again"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='precomputed_recommendations')
+    algorithm = models.CharField(max_length=50)
+    # Model release the list was computed from; lists of older releases are not served
+    release = models.CharField(max_length=100)
+    # [{"movie_id": ..., "title": ..., "genres": ..., "score": ...}], best first
+    recommendations = models.JSONField(default=list)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'algorithm')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.algorithm} ({self.release})"
+
+
+# -----------------------------------------------------------
+# RATING EVENT OUTBOX
+# -----------------------------------------------------------
+
+class RatingEvent(models.Model):
+    """Appended with every rating write; drained in batches into incremental ModelUpdateTasks"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rating_events')
+    rating = models.ForeignKey(Rating, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} - rating {self.rating_id}"
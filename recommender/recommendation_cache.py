@@ -0,0 +1,63 @@
+"""
+Served recommendation lists kept in the Django cache.
+
+Entries are keyed by user, mode, the versions of the models behind the list
+and request parameters, plus a per-user generation counter. Rating a movie
+bumps the user's generation and publishing one of those models changes the
+version, so stale lists are never read again and simply expire. Hits and misses are counted in the cache as
+well, so with Redis the counters are shared by every worker.
+"""
+from django.core.cache import cache
+
+RECOMMENDATION_CACHE_TIMEOUT = 60 * 60
+
+HITS_KEY = 'recommendations:hits'
+MISSES_KEY = 'recommendations:misses'
+
+
+def _generation_key(user_id):
+    return f'recommendations:generation:{user_id}'
+
+
+def _incr(key):
+    # add() is a no-op when the key exists, so concurrent first increments are not lost
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+        return 1
+
+
+def cache_key(user_id, mode, model_version, **params):
+    generation = cache.get(_generation_key(user_id), 0)
+    options = ':'.join(f'{name}={params[name]}' for name in sorted(params))
+    return f'recommendations:{user_id}:{mode}:{model_version}:{generation}:{options}'
+
+
+def lookup(key):
+    """The cached recommendation list for ``key``, or None; counts the hit or miss"""
+    recommendations = cache.get(key)
+    _incr(MISSES_KEY if recommendations is None else HITS_KEY)
+    return recommendations
+
+
+def store(key, recommendations):
+    cache.set(key, recommendations, RECOMMENDATION_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    """Make every cached list of the user unreachable, e.g. after a new rating"""
+    _incr(_generation_key(user_id))
+
+
+def stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
@@ -1,42 +1,146 @@
-from celery import shared_task
+from celery import shared_task, chain, chord, group
 from django.core.management import call_command
-from .models import ModelUpdateTask, Rating
+from django.db import transaction
+from .models import ModelUpdateTask, Rating, RatingEvent, Movie, PrecomputedRecommendation
+from .model_registry import registry, publish_release, release_dir
+from .engines.svd import SVDRecommender
+from .training_data import export_snapshot
+from .incremental import apply_rating_updates, LOOKUP_CHUNK_SIZE
 from django.utils import timezone
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
 
+# Pending incremental updates folded into the models per publish
+UPDATE_BATCH_SIZE = 500
+# Outbox events read per query while draining
+RATING_EVENT_BATCH_SIZE = 10000
+
+
+def _chunks(items, size=LOOKUP_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@shared_task
+def drain_rating_events():
+    """
+    Turn queued rating events into incremental update tasks
+    Runs every minute via Celery Beat
+
+    Events are read in large batches and coalesced per user: each user gets
+    one pending ModelUpdateTask pointing at their latest rating, or none if
+    they already have one waiting.
+    """
+    drained = queued = 0
+    while True:
+        with transaction.atomic():
+            # Locked until commit; a concurrent drain skips them instead of queueing them twice
+            events = list(
+                RatingEvent.objects.select_for_update(skip_locked=True)
+                .order_by('id').values_list('id', 'user_id', 'rating_id')[:RATING_EVENT_BATCH_SIZE]
+            )
+            if not events:
+                break
+
+            # Ordered by id, so the last event of a user carries their latest rating
+            latest_rating = {user_id: rating_id for _, user_id, rating_id in events}
+            waiting = set()
+            for user_ids in _chunks(latest_rating):
+                waiting.update(ModelUpdateTask.objects.filter(
+                    status='pending', task_type='incremental_update', triggered_by_user_id__in=user_ids,
+                ).values_list('triggered_by_user_id', flat=True))
+
+            ModelUpdateTask.objects.bulk_create([
+                ModelUpdateTask(triggered_by_user_id=user_id, triggered_by_rating_id=rating_id)
+                for user_id, rating_id in latest_rating.items() if user_id not in waiting
+            ])
+            for event_ids in _chunks(event_id for event_id, _, _ in events):
+                RatingEvent.objects.filter(id__in=event_ids).delete()
+
+        drained += len(events)
+        queued += len(latest_rating) - len(waiting)
+
+    return f"Drained {drained} rating events into {queued} update tasks"
+
+
+def _claim_pending_updates():
+    """Mark the oldest pending incremental updates processing and return them"""
+    with transaction.atomic():
+        pending = list(
+            ModelUpdateTask.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', task_type='incremental_update')
+            .order_by('created_at')[:UPDATE_BATCH_SIZE]
+        )
+        ModelUpdateTask.objects.filter(id__in=[task.id for task in pending]).update(
+            status='processing', started_at=timezone.now()
+        )
+    return pending
+
+
 @shared_task
 def process_model_updates():
     """
     Process pending model update tasks
-    Performs incremental updates to recommendation models
+    Runs every 5 minutes via Celery Beat
+
+    Users with pending updates are folded into the SVD and collaborative
+    models batch by batch, each batch republishing the models once, so their
+    new ratings show up without waiting for the daily retrain.
     """
-    pending_tasks = ModelUpdateTask.objects.filter(status='pending')[:10]
-    
-    for task in pending_tasks:
+    processed = 0
+    while True:
+        pending = _claim_pending_updates()
+        if not pending:
+            break
+
+        tasks = ModelUpdateTask.objects.filter(id__in=[task.id for task in pending])
+        user_ids = {task.triggered_by_user_id for task in pending if task.triggered_by_user_id}
         try:
-            task.status = 'processing'
-            task.started_at = timezone.now()
-            task.save()
-            
-            # Perform incremental model update
-            # This is a simplified version - in production, implement actual incremental learning
-            logger.info(f"Processing model update task {task.id}")
-            
-            # Mark as completed
-            task.status = 'completed'
-            task.completed_at = timezone.now()
-            task.save()
-            
+            applied = apply_rating_updates(user_ids)
         except Exception as e:
-            task.status = 'failed'
-            task.error_message = str(e)
-            task.save()
-            logger.error(f"Model update task {task.id} failed: {e}")
-    
-    return f"Processed {len(pending_tasks)} tasks"
+            tasks.update(status='failed', error_message=str(e), completed_at=timezone.now())
+            logger.error(f"Incremental model update failed: {e}")
+            break
+
+        if not applied:
+            tasks.update(status='pending', started_at=None)
+            logger.info("Models were replaced during the incremental update, retrying on the next run")
+            break
+
+        tasks.update(status='completed', completed_at=timezone.now())
+        processed += len(pending)
+
+    return f"Processed {processed} tasks"
+
+
+# Trainers of a full retrain; each one runs as its own task in parallel
+TRAINING_STAGES = {
+    'collaborative': 'train_collaborative_model',
+    'svd': 'train_svd_model',
+    'content': 'train_content_model',
+    'neural': 'train_neural_model',
+}
+# Stages whose failure does not block publishing the others
+OPTIONAL_STAGES = {'neural'}
+# Extra command options per stage: SVD and the neural model start from the
+# published models, and a redelivered neural stage picks up its checkpoint
+STAGE_OPTIONS = {
+    'svd': {'warm_start': True},
+    'neural': {'resume': True, 'warm_start': True},
+}
+
+
+def _record_stage(task_id, stage, duration):
+    """Merge one stage duration into the retrain's ModelUpdateTask"""
+    with transaction.atomic():
+        task = ModelUpdateTask.objects.select_for_update().get(id=task_id)
+        task.stage_durations[stage] = round(duration, 3)
+        task.save(update_fields=['stage_durations'])
 
 
 @shared_task
@@ -44,28 +148,171 @@ def retrain_all_models():
     """
     Full retraining of all recommendation models
     Runs daily via Celery Beat
+
+    Exports one training snapshot, trains every model from it in parallel
+    on the available workers and publishes the new artifacts together once
+    all trainers have finished, then precomputes the users' top-N lists.
     """
+    task = ModelUpdateTask.objects.create(
+        task_type='full_retrain',
+        status='processing',
+        started_at=timezone.now(),
+    )
+    logger.info(f"Starting full model retraining (task {task.id})...")
+
+    workflow = chain(
+        export_training_snapshot.si(task.id),
+        chord(
+            group(train_model_stage.s(stage, task.id) for stage in TRAINING_STAGES),
+            publish_models.s(task.id),
+        ),
+        precompute_recommendations.si(task.id),
+    )
+    workflow.on_error(retrain_failed.s(task.id)).apply_async()
+    return task.id
+
+
+@shared_task
+def export_training_snapshot(task_id):
+    """Read the database once; every trainer works from the snapshot"""
+    start = time.perf_counter()
+    snapshot_id = export_snapshot()
+    _record_stage(task_id, 'snapshot', time.perf_counter() - start)
+
+    logger.info(f"Exported training snapshot {snapshot_id}")
+    return snapshot_id
+
+
+@shared_task
+def train_model_stage(snapshot_id, stage, task_id):
+    """Train one model from the snapshot into the release directory"""
+    start = time.perf_counter()
     try:
-        logger.info("Starting full model retraining...")
-        
-        # Train all models
-        call_command('load_data')  # Original collaborative filtering
-        call_command('train_svd_model')
-        call_command('train_content_model')
-        call_command('create_hybrid_config')
-        
-        # Optional: Train neural model if PyTorch is available
-        try:
-            call_command('train_neural_model')
-        except Exception as e:
-            logger.warning(f"Neural model training skipped: {e}")
-        
-        logger.info("Full model retraining completed successfully")
-        return "All models retrained successfully"
-        
+        call_command(
+            TRAINING_STAGES[stage], snapshot=snapshot_id, output_dir=release_dir(snapshot_id),
+            **STAGE_OPTIONS.get(stage, {}),
+        )
     except Exception as e:
-        logger.error(f"Model retraining failed: {e}")
-        return f"Retraining failed: {e}"
+        if stage not in OPTIONAL_STAGES:
+            raise
+        logger.warning(f"{stage} model training skipped: {e}")
+        return {'snapshot_id': snapshot_id, 'stage': stage, 'trained': False}
+
+    _record_stage(task_id, stage, time.perf_counter() - start)
+    return {'snapshot_id': snapshot_id, 'stage': stage, 'trained': True}
+
+
+@shared_task
+def publish_models(results, task_id):
+    """Write the hybrid config and switch every worker to the new release at once"""
+    start = time.perf_counter()
+    snapshot_id = results[0]['snapshot_id']
+
+    call_command('create_hybrid_config', output_dir=release_dir(snapshot_id))
+    publish_release(snapshot_id)
+    _record_stage(task_id, 'publish', time.perf_counter() - start)
+
+    ModelUpdateTask.objects.filter(id=task_id).update(status='completed', completed_at=timezone.now())
+    trained = [result['stage'] for result in results if result['trained']]
+    logger.info(f"Full model retraining completed: published release {snapshot_id} ({', '.join(trained)})")
+    return f"Published release {snapshot_id}"
+
+
+@shared_task
+def retrain_failed(request, exc, traceback, task_id):
+    """Errback of the retrain workflow; the previous release stays published"""
+    logger.error(f"Model retraining failed: {exc}")
+    ModelUpdateTask.objects.filter(id=task_id).update(
+        status='failed',
+        error_message=str(exc),
+        completed_at=timezone.now(),
+    )
+
+
+# Top-N lists kept per user; requests for up to this many are served from them
+PRECOMPUTED_N = 100
+# Users per precompute task, spread over the workers
+PRECOMPUTE_CHUNK_SIZE = 2000
+
+
+def _release_svd_engine(release):
+    """
+    The SVD engine built from ``release``'s own artifact, or None once the
+    release or its SVD model was replaced. The file is checked now rather
+    than after ``CHECK_INTERVAL``, so a worker that still holds the previous
+    release's factors never stores lists under the new release.
+    """
+    if registry.manifest().get('release') != release:
+        return None
+    loaded = registry.get_loaded('svd', refresh=True)
+    if loaded is None or os.path.dirname(loaded.path) != release_dir(release, registry.model_dir):
+        return None
+    return registry.engine_for(loaded, SVDRecommender)
+
+
+@shared_task
+def precompute_recommendations(task_id=None):
+    """Fan the SVD top-N computation for every training user out to the workers"""
+    release = registry.manifest().get('release')
+    engine = _release_svd_engine(release) if release is not None else None
+    if engine is None or not engine.user_id_to_idx:
+        logger.warning("Skipping recommendation precomputation: no SVD model published with the release")
+        return "Nothing to precompute"
+
+    user_ids = sorted(engine.user_id_to_idx)
+    chunks = [user_ids[i:i + PRECOMPUTE_CHUNK_SIZE] for i in range(0, len(user_ids), PRECOMPUTE_CHUNK_SIZE)]
+    chord(
+        group(precompute_user_chunk.s(chunk, release) for chunk in chunks),
+        precompute_finished.s(release, task_id, time.time()),
+    ).apply_async()
+    return f"Precomputing recommendations for {len(user_ids)} users in {len(chunks)} chunks"
+
+
+@shared_task
+def precompute_user_chunk(user_ids, release):
+    """Score one chunk of users against every movie and upsert their lists"""
+    engine = _release_svd_engine(release)
+    if engine is None:
+        logger.info(f"Release {release} or its SVD model was replaced, skipping precompute chunk")
+        return 0
+
+    rated = {}
+    for user_id, movie_id in Rating.objects.filter(user_id__in=user_ids).values_list('user_id', 'movie__movie_id'):
+        rated.setdefault(user_id, []).append(movie_id)
+    recommended = engine.recommend_batch(user_ids, rated, n=PRECOMPUTED_N)
+
+    movie_ids = {movie_id for pairs in recommended.values() for movie_id, _ in pairs}
+    movies = Movie.objects.in_bulk(movie_ids, field_name='movie_id')
+    rows = [
+        PrecomputedRecommendation(
+            user_id=user_id,
+            algorithm=engine.name,
+            release=release,
+            recommendations=[
+                {'movie_id': movie_id, 'title': movies[movie_id].title, 'genres': movies[movie_id].genres, 'score': round(score, 4)}
+                for movie_id, score in pairs if movie_id in movies
+            ],
+        )
+        for user_id, pairs in recommended.items()
+    ]
+    PrecomputedRecommendation.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['user', 'algorithm'],
+        update_fields=['release', 'recommendations', 'computed_at'],
+    )
+    return len(rows)
+
+
+@shared_task
+def precompute_finished(counts, release, task_id, started_at):
+    """Drop the lists of earlier releases and record how long precomputation took"""
+    PrecomputedRecommendation.objects.filter(algorithm=SVDRecommender.name).exclude(release=release).delete()
+    if task_id is not None:
+        _record_stage(task_id, 'precompute', time.time() - started_at)
+    logger.info(f"Precomputed recommendations for {sum(counts)} users (release {release})")
+    return f"Precomputed {sum(counts)} recommendation lists"
 
 
 @shared_task
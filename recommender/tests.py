@@ -1,3 +1,854 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from scipy.sparse import csr_matrix, random as sparse_random
+from sklearn.decomposition import TruncatedSVD
+
+from abtesting.models import AlgorithmPerformance
+
+from . import recommendation_cache
+from .engines.ann import IVFIndex, benchmark, build_ivf_index
+from .engines.content import ContentRecommender
+from .engines.neural import PYTORCH_AVAILABLE, NeuralRecommender
+from .engines.neighbors import top_k_similar
+from .engines.pipeline import (
+    CandidateGenerator, PopularCandidates, RecommendationPipeline, SVDCandidates, UserContext, default_pipeline,
+)
+from .engines.svd import SVDRecommender
+from .incremental import apply_rating_updates, update_collaborative, update_svd
+from .ingest import insert_ratings
+from .management.commands import train_neural_model, train_svd_model
+from .model_registry import (
+    RELEASES_TO_KEEP, ModelRegistry, publish_artifacts, publish_if_current, publish_release, read_manifest, registry,
+    release_dir, save_artifact,
+)
+from .models import ModelUpdateTask, Movie, PrecomputedRecommendation, Rating, RatingEvent, UserProfile
+from .tasks import drain_rating_events, precompute_user_chunk
+
+if PYTORCH_AVAILABLE:
+    import torch
+
+    from .engines.neural import NeuralCollaborativeFiltering
+
+
+class FakeEngine:
+    def __init__(self, data):
+        self.data = data
+
+
+class TemporaryModelDirMixin:
+    """A fresh model directory and a registry that checks it on every call"""
+
+    def setUp(self):
+        super().setUp()
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        self.registry = ModelRegistry(model_dir=self.model_dir, check_interval=0)
+
+    def stage(self, release, name, data):
+        return save_artifact(name, data, model_dir=release_dir(release, self.model_dir))
+
+
+class PublishedModelsMixin(TemporaryModelDirMixin):
+    """Points the process-wide registry the views serve from at the temporary model directory"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        patcher = mock.patch.multiple(registry, model_dir=self.model_dir, check_interval=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.registry = registry
+
+
+class InsertRatingsTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}') for i in range(2)]
+        self.movies = Movie.objects.bulk_create([
+            Movie(movie_id=movie_id, title=f'Movie {movie_id}') for movie_id in (1, 2)
+        ])
+
+    def test_dataset_timestamps_are_kept(self):
+        inserted = insert_ratings(
+            np.array([self.users[0].id, self.users[1].id]),
+            np.array([self.movies[0].id, self.movies[1].id]),
+            np.array([4, 2]),
+            np.array([881250949, 891717742]),
+        )
+
+        self.assertEqual(inserted, 2)
+        rows = Rating.objects.order_by('user_id').values_list('rating', 'timestamp', 'updated_at')
+        for (rating, timestamp, updated_at), (expected_rating, expected_ts) in zip(
+            rows, [(4, 881250949), (2, 891717742)]
+        ):
+            self.assertEqual(rating, expected_rating)
+            self.assertEqual(timestamp.timestamp(), expected_ts)
+            self.assertEqual(updated_at, timestamp)
+
+    def test_ratings_saved_afterwards_still_get_the_current_time(self):
+        insert_ratings(np.array([self.users[0].id]), np.array([self.movies[0].id]), np.array([4]), np.array([0]))
+        rating = Rating.objects.create(user=self.users[1], movie=self.movies[1], rating=5)
+        self.assertGreater(rating.timestamp.year, 2000)
+
+    def test_ratings_without_timestamps_get_the_insert_time(self):
+        insert_ratings(np.array([self.users[0].id]), np.array([self.movies[0].id]), np.array([3]))
+        self.assertGreater(Rating.objects.get().timestamp.year, 2000)
+
+
+class SVDFoldInTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.matrix = csr_matrix(
+            (rng.random((40, 30)) < 0.3) * rng.integers(1, 6, size=(40, 30)), dtype=np.float64
+        )
+        self.svd = TruncatedSVD(n_components=8, random_state=42)
+        user_factors = self.svd.fit_transform(self.matrix)
+        self.movie_ids = np.arange(101, 131)
+        self.engine = SVDRecommender({
+            'movie_ids': self.movie_ids,
+            'movie_factors': self.svd.components_.T,
+            'user_ids': list(range(40)),
+            'user_factors': user_factors,
+        })
+
+    def ratings_of(self, row):
+        return {int(self.movie_ids[col]): float(value) for col, value in zip(row.indices, row.data)}
+
+    def test_fold_in_is_the_truncated_svd_projection(self):
+        for user in range(5):
+            row = self.matrix[user]
+            np.testing.assert_allclose(
+                self.engine.fold_in(self.ratings_of(row)), self.svd.transform(row)[0], rtol=1e-4, atol=1e-5
+            )
+
+    def test_unknown_users_are_folded_in_and_known_users_read_their_factors(self):
+        ratings = self.ratings_of(self.matrix[3])
+        np.testing.assert_allclose(
+            self.engine.user_vector(999, ratings), self.engine.user_factors[3], rtol=1e-4, atol=1e-5
+        )
+        np.testing.assert_array_equal(self.engine.user_vector(3, {}), self.engine.user_factors[3])
+
+    def test_users_without_known_movies_have_no_vector(self):
+        self.assertIsNone(self.engine.fold_in({}))
+        self.assertIsNone(self.engine.user_vector(999, {5000: 5}))
+
+
+@unittest.skipUnless(PYTORCH_AVAILABLE, 'PyTorch is not installed')
+class NeuralTrainingTests(SimpleTestCase):
+    def setUp(self):
+        self.command = train_neural_model.Command(stdout=StringIO())
+        checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, checkpoint_dir, ignore_errors=True)
+        self.command.checkpoint_path = os.path.join(checkpoint_dir, train_neural_model.CHECKPOINT_FILE)
+
+    def samples(self, n, seed=0):
+        generator = torch.Generator().manual_seed(seed)
+        return (
+            torch.randint(0, 4, (n,), generator=generator),
+            torch.randint(0, 6, (n,), generator=generator),
+            torch.randint(0, 5, (n,), generator=generator).float() / 4,
+        )
+
+    def model(self):
+        torch.manual_seed(0)
+        return NeuralCollaborativeFiltering(4, 6, embedding_dim=4, hidden_layers=[4])
+
+    def train(self, model, train, **kwargs):
+        options = {'epochs': 10, 'batch_size': 8, 'lr': 0.01, 'patience': 2, 'checkpoint_every': 0}
+        return self.command.train_model(model, train, self.samples(8, seed=1), **{**options, **kwargs})
+
+    def test_split_holds_out_the_latest_ratings_by_rank(self):
+        samples = (torch.arange(10),) * 3
+        # Four ratings share the timestamp at the split; the held-out share stays exact
+        timestamps = np.array([5, 1, 3, 3, 8, 2, 3, 3, 0, 9])
+
+        train, validation = self.command.split_by_time(samples, timestamps, 0.5)
+        self.assertEqual(sorted(timestamps[train[0].numpy()]), [0, 1, 2, 3, 3])
+        self.assertEqual(sorted(timestamps[validation[0].numpy()]), [3, 3, 5, 8, 9])
+        self.assertEqual(sorted(validation[0].tolist() + train[0].tolist()), list(range(10)))
+
+        train, validation = self.command.split_by_time(samples, np.zeros(10), 0.25)
+        self.assertEqual((len(train[0]), len(validation[0])), (7, 3))
+        self.assertEqual(self.command.split_by_time(samples, timestamps, 0), (samples, None))
+
+    def test_early_stopping_keeps_the_best_epoch(self):
+        model = self.model()
+        states = []
+
+        def evaluate(model, samples):
+            states.append({key: value.clone() for key, value in model.state_dict().items()})
+            return [1.0, 0.8, 0.9, 0.95, 0.7][len(states) - 1]
+
+        with mock.patch.object(self.command, 'evaluate', side_effect=evaluate):
+            progress = self.train(model, self.samples(32))
+
+        self.assertEqual((progress['epoch'], progress['best_epoch'], progress['best_rmse']), (4, 2, 0.8))
+        for key, value in model.state_dict().items():
+            torch.testing.assert_close(value, states[1][key], rtol=0, atol=0)
+
+    def test_resume_continues_a_checkpoint_of_the_same_data_only(self):
+        train = self.samples(32)
+        trained = self.model()
+        self.train(trained, train, epochs=2, patience=10, checkpoint_every=1)
+
+        # Nothing left to train: the resumed run only restores the best weights
+        resumed = self.model()
+        self.assertEqual(self.train(resumed, train, epochs=2, patience=10, resume=True)['epoch'], 2)
+        for key, value in resumed.state_dict().items():
+            torch.testing.assert_close(value, trained.state_dict()[key], rtol=0, atol=0)
+
+        refused = self.model()
+        progress = self.train(refused, self.samples(32, seed=2), epochs=1, patience=10, resume=True)
+        self.assertEqual(progress['epoch'], 1)
+        self.assertIn('Checkpoint was made on different data', self.command.stdout.getvalue())
+
+
+class WarmStartTests(SimpleTestCase):
+    def test_svd_starts_from_the_previous_factors_of_each_movie_id(self):
+        rng = np.random.default_rng(7)
+        matrix = csr_matrix((rng.random((30, 6)) < 0.5) * rng.integers(1, 6, size=(30, 6)), dtype=np.float64)
+        previous_factors = rng.standard_normal((5, 3))
+        previous = {'movie_ids': np.array([10, 20, 30, 40, 50]), 'movie_factors': previous_factors}
+        # Reordered, one movie dropped and a new one (60) added
+        movie_ids = np.array([30, 10, 60, 50, 20, 70])
+        command = train_svd_model.Command(stdout=StringIO())
+
+        with mock.patch('numpy.linalg.qr', wraps=np.linalg.qr) as qr:
+            user_factors, movie_factors, _ = command.warm_start_svd(matrix, movie_ids, previous, 3)
+
+        initial = qr.call_args_list[0].args[0]
+        np.testing.assert_array_equal(initial[[0, 1, 3, 4]], previous_factors[[2, 0, 4, 1]])
+        # Whatever the start, the result is the top singular subspace
+        singular_values = np.linalg.svd(matrix.toarray(), compute_uv=False)[:3]
+        np.testing.assert_allclose(np.linalg.norm(user_factors, axis=0), singular_values, rtol=1e-2)
+        self.assertEqual(movie_factors.shape, (6, 3))
+
+    @unittest.skipUnless(PYTORCH_AVAILABLE, 'PyTorch is not installed')
+    def test_neural_embeddings_follow_their_ids(self):
+        torch.manual_seed(0)
+        previous_model = NeuralCollaborativeFiltering(2, 2, embedding_dim=4, hidden_layers=[4])
+        previous = {
+            'model_state_dict': previous_model.state_dict(),
+            'user_map': {1: 0, 2: 1},
+            'movie_map': {10: 0, 20: 1},
+        }
+        model = NeuralCollaborativeFiltering(2, 3, embedding_dim=4, hidden_layers=[4])
+        new_user = model.user_embedding.weight[1].clone()
+        command = train_neural_model.Command(stdout=StringIO())
+
+        self.assertTrue(command.warm_start(model, previous, {2: 0, 3: 1}, {20: 0, 30: 1, 10: 2}))
+        old_users, old_movies = previous_model.user_embedding.weight, previous_model.movie_embedding.weight
+        torch.testing.assert_close(model.user_embedding.weight[0], old_users[1], rtol=0, atol=0)
+        torch.testing.assert_close(model.user_embedding.weight[1], new_user, rtol=0, atol=0)
+        torch.testing.assert_close(model.movie_embedding.weight[[0, 2]], old_movies[[1, 0]], rtol=0, atol=0)
+        for key, value in model.mlp.state_dict().items():
+            torch.testing.assert_close(value, previous_model.mlp.state_dict()[key], rtol=0, atol=0)
+
+        wider = NeuralCollaborativeFiltering(2, 3, embedding_dim=8, hidden_layers=[4])
+        self.assertFalse(command.warm_start(wider, previous, {2: 0, 3: 1}, {20: 0, 30: 1, 10: 2}))
+
+
+class ContentProfileTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.movie_ids = np.arange(1, 51)
+        tfidf = sparse_random(50, 80, density=0.1, format='csr', dtype=np.float32, random_state=5)
+        self.engine = ContentRecommender({'movie_ids': self.movie_ids, 'tfidf_matrix': tfidf})
+        self.engine.model_version = 'v1'
+        self.ratings = {1: 5, 2: 3, 3: 4, 10: 1}
+
+    def full_profile(self, ratings):
+        return ContentRecommender(self.engine.model)._weighted_rows(ratings)
+
+    def test_profile_is_updated_by_the_changed_ratings_only(self):
+        self.engine.profile(7, self.ratings)
+        changed = {1: 2, 3: 4, 10: 1, 20: 5}  # 1 changed, 2 removed, 20 added
+
+        with mock.patch.object(self.engine, '_weighted_rows', wraps=self.engine._weighted_rows) as weighted:
+            profile = self.engine.profile(7, changed)
+        weighted.assert_called_once_with({1: -3, 20: 5, 2: -3})
+        np.testing.assert_allclose(profile, self.full_profile(changed), atol=1e-6)
+
+    def test_unchanged_ratings_reuse_the_cached_profile(self):
+        first = self.engine.profile(7, self.ratings)
+        with mock.patch.object(self.engine, '_weighted_rows') as weighted:
+            np.testing.assert_array_equal(self.engine.profile(7, dict(self.ratings)), first)
+        weighted.assert_not_called()
+
+    def test_update_profile_folds_in_one_rating(self):
+        self.engine.profile(7, self.ratings)
+        self.engine.update_profile(7, 2, 5)
+        self.engine.update_profile(7, 30, 4)
+        updated = {**self.ratings, 2: 5, 30: 4}
+
+        with mock.patch.object(self.engine, '_weighted_rows') as weighted:
+            profile = self.engine.profile(7, updated)
+        weighted.assert_not_called()
+        np.testing.assert_allclose(profile, self.full_profile(updated), atol=1e-6)
+
+    def test_profiles_of_another_model_version_are_not_reused(self):
+        self.engine.profile(7, self.ratings)
+        other = ContentRecommender(self.engine.model)
+        other.model_version = 'v2'
+        with mock.patch.object(other, '_weighted_rows', wraps=other._weighted_rows) as weighted:
+            other.profile(7, self.ratings)
+        weighted.assert_called_once_with(self.ratings)
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+        self.queries = rng.normal(size=(50, 16)).astype(np.float32)
+        self.index = IVFIndex(build_ivf_index(self.vectors, n_lists=32))
+
+    def test_probing_every_list_is_exact(self):
+        for query in self.queries[:10]:
+            idx, scores = self.index.search(query, 10, n_probe=self.index.n_lists)
+            exact = np.argsort(-(self.vectors @ query), kind='stable')[:10]
+            self.assertEqual(set(idx.tolist()), set(exact.tolist()))
+            np.testing.assert_allclose(scores, self.vectors[idx] @ query, rtol=1e-5)
+            self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_recall_grows_with_n_probe(self):
+        results = benchmark(self.index, self.vectors, self.queries, n=10, n_probes=(1, 8, 32))
+        recalls = [row['recall'] for row in results]
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreaterEqual(recalls[1], 0.7)
+        self.assertEqual(recalls[-1], 1.0)
+
+    def test_excluded_items_are_never_returned(self):
+        query = self.queries[0]
+        best = self.index.search(query, 20, n_probe=self.index.n_lists)[0]
+        idx, _ = self.index.search(query, 20, n_probe=self.index.n_lists, exclude=best[:5])
+        self.assertFalse(set(best[:5].tolist()) & set(idx.tolist()))
+        self.assertEqual(idx[:15].tolist(), best[5:].tolist())
+
+    def test_cosine_index_ignores_query_norm(self):
+        index = IVFIndex(build_ivf_index(self.vectors, n_lists=32, metric='cosine'))
+        query = self.queries[0]
+        np.testing.assert_array_equal(index.search(query, 10, 4)[0], index.search(query * 7, 10, 4)[0])
+
+
+@unittest.skipUnless(PYTORCH_AVAILABLE, 'PyTorch is not installed')
+class NeuralRecommenderTests(SimpleTestCase):
+    def setUp(self):
+        self.network = NeuralCollaborativeFiltering(3, 5, embedding_dim=4, hidden_layers=[8])
+        # Multiples of 1/8 keep every product and sum exact in float32, whatever the order
+        generator = torch.Generator().manual_seed(0)
+        with torch.no_grad():
+            for parameter in self.network.parameters():
+                parameter.copy_(torch.randint(-4, 5, parameter.shape, generator=generator) / 8)
+        self.network.eval()
+        self.model = {
+            'model_state_dict': self.network.state_dict(),
+            'user_map': {101: 0, 102: 1, 103: 2},
+            'movie_map': {movie_id: idx for idx, movie_id in enumerate(range(10, 15))},
+        }
+
+    def engine(self, micro_batch_ms=0):
+        with self.settings(NEURAL_MICRO_BATCH_MS=micro_batch_ms):
+            return NeuralRecommender(self.model)
+
+    def forward(self, user_idx, movie_indices):
+        with torch.inference_mode():
+            users = torch.full((len(movie_indices),), user_idx)
+            return self.network(users, torch.tensor(movie_indices)).numpy() * 4 + 1
+
+    def test_precomputed_movie_half_matches_the_full_forward_pass(self):
+        engine = self.engine()
+        for user_id, user_idx in self.model['user_map'].items():
+            np.testing.assert_array_equal(engine.score(user_id, {}), self.forward(user_idx, range(5)))
+            np.testing.assert_array_equal(
+                engine.score_items(user_id, {}, [14, 99, 11]),
+                [self.forward(user_idx, [4])[0], -np.inf, self.forward(user_idx, [1])[0]],
+            )
+        self.assertIsNone(engine.score(999, {}))
+
+    def test_micro_batcher_returns_each_caller_its_own_rows(self):
+        engine = self.engine(micro_batch_ms=500)
+        calls = []
+        score_batch = engine.batcher.score_batch
+
+        def recording(users, movies):
+            calls.append(users)
+            return score_batch(users, movies)
+
+        engine.batcher.score_batch = recording
+        requests = {101: [10, 11, 12, 13, 14], 102: [13], 103: [12, 10]}
+        barrier = threading.Barrier(len(requests))
+        results = {}
+
+        def request(user_id):
+            barrier.wait()
+            results[user_id] = engine.score_items(user_id, {}, requests[user_id])
+
+        threads = [threading.Thread(target=request, args=(user_id,)) for user_id in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(calls), len(requests))
+        for user_id, movie_ids in requests.items():
+            expected = self.forward(self.model['user_map'][user_id], [movie_id - 10 for movie_id in movie_ids])
+            np.testing.assert_array_equal(results[user_id], expected)
+
+
+class TopKSimilarTests(SimpleTestCase):
+    def test_matches_dense_cosine_similarity(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.random((300, 12))
+        # A tiny block size forces several row blocks
+        indices, scores = top_k_similar(vectors, k=5, max_block_elements=1000)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = normalized @ normalized.T
+        np.fill_diagonal(similarity, -np.inf)
+        expected = np.argsort(-similarity, axis=1, kind='stable')[:, :5]
+
+        self.assertEqual(indices.shape, (300, 5))
+        np.testing.assert_array_equal(np.sort(indices, axis=1), np.sort(expected, axis=1))
+        np.testing.assert_allclose(scores, np.take_along_axis(similarity, indices, axis=1), rtol=1e-5)
+        self.assertFalse(np.any(indices == np.arange(300)[:, None]))
+
+    def test_k_is_capped_by_the_catalogue(self):
+        indices, scores = top_k_similar(np.eye(3), k=10)
+        self.assertEqual(indices.shape, (3, 2))
+        self.assertEqual(top_k_similar(np.ones((1, 4)), k=10)[0].shape, (1, 0))
+
+
+class PublishReleaseTests(TemporaryModelDirMixin, SimpleTestCase):
+    def test_staged_artifacts_go_live_together_on_publish(self):
+        self.stage('r1', 'svd', {'release': 'r1'})
+        self.stage('r1', 'content', {'release': 'r1'})
+        self.assertIsNone(self.registry.get('svd'))
+
+        publish_release('r1', self.model_dir)
+        self.assertEqual(self.registry.get('svd'), {'release': 'r1'})
+        version = self.registry.version()
+
+        self.stage('r2', 'svd', {'release': 'r2'})
+        self.stage('r2', 'content', {'release': 'r2'})
+        # Staging alone does not change what is served
+        self.assertEqual(self.registry.get('svd'), {'release': 'r1'})
+
+        publish_release('r2', self.model_dir)
+        self.assertEqual(self.registry.get('svd'), {'release': 'r2'})
+        self.assertEqual(self.registry.get('content'), {'release': 'r2'})
+        self.assertNotEqual(self.registry.version(), version)
+
+    def test_engine_is_rebuilt_after_a_hot_swap(self):
+        self.stage('r1', 'svd', {'release': 'r1'})
+        publish_release('r1', self.model_dir)
+        first = self.registry.get_engine('svd', FakeEngine)
+
+        self.assertIs(self.registry.get_engine('svd', FakeEngine), first)
+        self.stage('r2', 'svd', {'release': 'r2'})
+        publish_release('r2', self.model_dir)
+        second = self.registry.get_engine('svd', FakeEngine)
+        self.assertEqual(second.data, {'release': 'r2'})
+        self.assertNotEqual(second.model_version, first.model_version)
+
+    def test_artifacts_missing_from_a_release_keep_their_entry(self):
+        self.stage('r1', 'svd', {'release': 'r1'})
+        self.stage('r1', 'content', {'release': 'r1'})
+        publish_release('r1', self.model_dir)
+        self.stage('r2', 'svd', {'release': 'r2'})
+        publish_release('r2', self.model_dir)
+
+        self.assertEqual(self.registry.get('content'), {'release': 'r1'})
+        self.assertEqual(read_manifest(self.model_dir)['release'], 'r2')
+
+    def test_old_unreferenced_releases_are_pruned(self):
+        releases = [f'r{i}' for i in range(RELEASES_TO_KEEP + 3)]
+        for release in releases:
+            self.stage(release, 'svd', {'release': release})
+            publish_release(release, self.model_dir)
+
+        kept = sorted(os.listdir(os.path.join(self.model_dir, 'releases')))
+        self.assertEqual(kept, releases[-(RELEASES_TO_KEEP + 1):])
+        self.assertEqual(self.registry.get('svd'), {'release': releases[-1]})
+
+
+class SlowLoadingCandidates(CandidateGenerator):
+    """Takes longer to load than the whole retrieval budget"""
+    name = 'slow'
+
+    def prepare(self):
+        time.sleep(0.05)
+
+    def candidates(self, context, budget, engine=None, **options):
+        return [1]
+
+
+class PipelineTests(TemporaryModelDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        rng = np.random.default_rng(2)
+        self.movie_ids = np.arange(1, 61)
+        movie_factors = rng.normal(size=(60, 4)).astype(np.float32)
+        user_factors = rng.normal(size=(1, 4)).astype(np.float32)
+        Movie.objects.bulk_create([
+            Movie(movie_id=movie_id, title=f'Movie {movie_id}', genres='Drama' if movie_id % 2 else 'Comedy',
+                  view_count=100 - movie_id)
+            for movie_id in self.movie_ids.tolist()
+        ])
+
+        neighbor_indices, neighbor_scores = top_k_similar(movie_factors, k=5)
+        self.stage('r1', 'svd', {
+            'movie_ids': self.movie_ids,
+            'movie_factors': movie_factors,
+            'user_ids': [7],
+            'user_factors': user_factors,
+            'ann_index': build_ivf_index(movie_factors, n_lists=4),
+        })
+        self.stage('r1', 'collaborative_item', {
+            'movie_ids': self.movie_ids,
+            'neighbor_indices': neighbor_indices,
+            'neighbor_scores': neighbor_scores,
+        })
+        publish_release('r1', self.model_dir)
+        self.engine = self.registry.get_engine('svd', SVDRecommender)
+
+        # The user rated their 10 best SVD movies and the 10 most viewed ones
+        best = self.movie_ids[np.argsort(-(movie_factors @ user_factors[0]))[:10]].tolist()
+        self.ratings = {movie_id: 5 for movie_id in best + list(range(1, 11))}
+        self.context = UserContext(7, self.ratings, ['Drama'])
+
+    def test_generators_only_propose_unrated_movies(self):
+        for generator in default_pipeline(self.registry).generators:
+            candidates = generator.candidates(self.context, 20, engine=generator.prepare())
+            self.assertTrue(candidates, generator.name)
+            self.assertFalse(set(candidates) & set(self.ratings), generator.name)
+
+    def test_svd_generator_spends_its_budget_on_unrated_movies(self):
+        generator = SVDCandidates(self.registry)
+        candidates = generator.candidates(self.context, 20, engine=generator.prepare())
+        exact = [movie_id for movie_id, _ in self.engine.recommend(7, self.ratings, n=20, n_probe=0)]
+        self.assertEqual(candidates, exact)
+
+    def test_svd_generator_searches_the_index_with_the_requested_n_probe(self):
+        generator = SVDCandidates(self.registry)
+        candidates = generator.candidates(self.context, 10, engine=generator.prepare(), n_probe=1)
+        self.assertFalse(set(candidates) & set(self.ratings))
+        self.assertEqual(candidates, [movie_id for movie_id, _ in self.engine.recommend(7, self.ratings, n=10, n_probe=1)])
+
+    def test_svd_ranking_matches_exhaustive_scoring(self):
+        stats = {}
+        recommended = default_pipeline(self.registry).recommend(self.engine, self.context, n=10, stats=stats)
+        self.assertEqual(recommended, self.engine.recommend(7, self.ratings, n=10, n_probe=0))
+        self.assertLessEqual(stats['candidates'], 500)
+
+    def test_popular_movies_are_the_most_rated(self):
+        first, second = [movie_id for movie_id in range(60, 0, -1) if movie_id not in self.ratings][:2]
+        movies = Movie.objects.in_bulk([first, second], field_name='movie_id')
+        for i in range(3):
+            user = User.objects.create(username=f'rater{i}')
+            Rating.objects.create(user=user, movie=movies[first], rating=4)
+            if i:
+                Rating.objects.create(user=user, movie=movies[second], rating=4)
+
+        generator = PopularCandidates(self.registry)
+        self.assertEqual(generator.candidates(self.context, 3)[:2], [first, second])
+
+    def test_each_generator_is_prepared_once_per_request(self):
+        pipeline = default_pipeline(self.registry)
+        with mock.patch.object(SVDCandidates, 'prepare', autospec=True, side_effect=SVDCandidates.prepare) as prepare:
+            pipeline.candidates(self.context)
+        self.assertEqual(prepare.call_count, 1)
+
+    def test_model_loading_does_not_use_up_the_retrieval_budget(self):
+        pipeline = RecommendationPipeline(
+            [SlowLoadingCandidates(self.registry), PopularCandidates(self.registry)], retrieval_budget_ms=20,
+        )
+        times = {}
+        candidates = pipeline.candidates(self.context, times)
+        self.assertEqual(set(times), {'slow', 'popular'})
+        self.assertIn(11, candidates)
+
+
+class IncrementalUpdateTests(TemporaryModelDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('recommender.incremental.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+        self.movies = Movie.objects.bulk_create([
+            Movie(movie_id=movie_id, title=f'Movie {movie_id}') for movie_id in (1, 2, 3)
+        ])
+        self.movie_ids = np.array([1, 2, 3])
+        # Orthonormal, like TruncatedSVD's components
+        self.movie_factors = np.linalg.qr(np.random.default_rng(3).normal(size=(3, 2)))[0].astype(np.float32)
+        first, second = self.users[0].id, self.users[1].id
+
+        self.stage('r1', 'svd', {
+            'movie_ids': self.movie_ids,
+            'movie_factors': self.movie_factors,
+            'user_ids': [first, second],
+            'user_factors': np.ones((2, 2), dtype=np.float32),
+        })
+        self.stage('r1', 'collaborative', {
+            'user_item_matrix': csr_matrix(np.array([[5, 3, 0], [0, 1, 4]], dtype=np.float32)),
+            'row_norms': np.array([np.sqrt(34), np.sqrt(17)], dtype=np.float32),
+            'user_ids': [first, second],
+            'user_id_to_idx': {first: 0, second: 1},
+            'movie_ids': self.movie_ids,
+            'movie_id_to_idx': {1: 0, 2: 1, 3: 2},
+        })
+        publish_release('r1', self.model_dir)
+
+    def test_collaborative_rows_are_replaced_and_new_users_appended(self):
+        first, second, new = (user.id for user in self.users)
+        loaded = self.registry.get_loaded('collaborative')
+        # Movie 99 is not in the catalogue and is ignored
+        model = update_collaborative(loaded, {first: {3: 4}, new: {1: 2, 99: 5}})
+
+        np.testing.assert_array_equal(model['user_item_matrix'].toarray(), [[0, 0, 4], [0, 1, 4], [2, 0, 0]])
+        np.testing.assert_allclose(model['row_norms'], [4, np.sqrt(17), 2])
+        self.assertEqual(model['user_ids'], [first, second, new])
+        self.assertEqual(model['user_id_to_idx'][new], 2)
+        # The loaded artifact is left untouched
+        self.assertEqual(loaded.data['user_item_matrix'][0, 0], 5)
+        self.assertNotIn(new, loaded.data['user_id_to_idx'])
+
+    def test_svd_rows_are_refitted_and_new_users_appended(self):
+        first, second, new = (user.id for user in self.users)
+        loaded = self.registry.get_loaded('svd')
+        model = update_svd(loaded, {first: {1: 5, 3: 1}, new: {2: 4}})
+
+        ratings = np.array([[5, 0, 1], [0, 4, 0]], dtype=np.float32)
+        least_squares = np.linalg.lstsq(self.movie_factors, ratings.T, rcond=None)[0].T
+        np.testing.assert_allclose(model['user_factors'][[0, 2]], least_squares, rtol=1e-5)
+        np.testing.assert_array_equal(model['user_factors'][1], [1, 1])
+        self.assertEqual(model['user_ids'], [first, second, new])
+        self.assertEqual(len(loaded.data['user_ids']), 2)
+
+    def test_users_without_known_movies_are_not_added_to_svd(self):
+        loaded = self.registry.get_loaded('svd')
+        model = update_svd(loaded, {self.users[2].id: {99: 5}})
+        self.assertEqual(len(model['user_ids']), 2)
+
+    def test_apply_rating_updates_publishes_the_current_ratings(self):
+        new = self.users[2]
+        Rating.objects.create(user=new, movie=self.movies[1], rating=4)
+
+        self.assertTrue(apply_rating_updates([new.id]))
+        self.assertEqual(self.registry.get('svd')['user_ids'][-1], new.id)
+        collaborative = self.registry.get('collaborative')
+        self.assertEqual(collaborative['user_item_matrix'][collaborative['user_id_to_idx'][new.id], 1], 4)
+
+    def test_an_update_built_on_a_replaced_model_is_not_published(self):
+        first, _, new = (user.id for user in self.users)
+        loaded = self.registry.get_loaded('svd')
+        first_update = {'svd': (loaded, update_svd(loaded, {first: {1: 5}}))}
+        second_update = {'svd': (loaded, update_svd(loaded, {new: {2: 4}}))}
+
+        self.assertTrue(publish_if_current(first_update, self.registry))
+        self.assertFalse(publish_if_current(second_update, self.registry))
+        self.assertNotIn(new, self.registry.get('svd')['user_ids'])
+        self.assertEqual([f for f in os.listdir(self.model_dir) if '.tmp' in f], [])
+
+
+class DrainRatingEventsTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+        self.movies = Movie.objects.bulk_create([
+            Movie(movie_id=movie_id, title=f'Movie {movie_id}') for movie_id in range(1, 4)
+        ])
+
+    def rate(self, user, movie, rating=4):
+        rating = Rating.objects.create(user=user, movie=movie, rating=rating)
+        RatingEvent.objects.create(user=user, rating=rating)
+        return rating
+
+    def test_ratings_of_a_user_are_merged_into_one_task(self):
+        first, second, _ = self.users
+        latest = [self.rate(first, movie) for movie in self.movies][-1]
+        self.rate(second, self.movies[0])
+
+        self.assertEqual(drain_rating_events(), 'Drained 4 rating events into 2 update tasks')
+        tasks = ModelUpdateTask.objects.filter(status='pending', task_type='incremental_update')
+        self.assertEqual(sorted(tasks.values_list('triggered_by_user_id', flat=True)), [first.id, second.id])
+        self.assertEqual(tasks.get(triggered_by_user=first).triggered_by_rating_id, latest.id)
+        self.assertFalse(RatingEvent.objects.exists())
+
+    def test_users_with_a_pending_task_get_no_second_one(self):
+        user = self.users[0]
+        ModelUpdateTask.objects.create(triggered_by_user=user)
+        self.rate(user, self.movies[0])
+
+        drain_rating_events()
+        self.assertEqual(ModelUpdateTask.objects.filter(triggered_by_user=user).count(), 1)
+        self.assertFalse(RatingEvent.objects.exists())
+
+    def test_events_spanning_several_batches_still_give_one_task_per_user(self):
+        for user in self.users:
+            for movie in self.movies:
+                self.rate(user, movie)
+
+        with mock.patch('recommender.tasks.RATING_EVENT_BATCH_SIZE', 2):
+            drain_rating_events()
+        self.assertEqual(
+            sorted(ModelUpdateTask.objects.values_list('triggered_by_user_id', flat=True)),
+            sorted(user.id for user in self.users),
+        )
+        self.assertFalse(RatingEvent.objects.exists())
+
+    def test_events_are_read_locked_so_concurrent_drains_skip_them(self):
+        self.rate(self.users[0], self.movies[0])
+        with mock.patch.object(
+            RatingEvent.objects, 'select_for_update', wraps=RatingEvent.objects.select_for_update,
+        ) as select_for_update:
+            drain_rating_events()
+        select_for_update.assert_called_with(skip_locked=True)
+        self.assertFalse(RatingEvent.objects.exists())
+
+
+class PrecomputeTests(PublishedModelsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create(username=f'user{i}') for i in range(2)]
+        Movie.objects.bulk_create([Movie(movie_id=movie_id, title=f'Movie {movie_id}') for movie_id in range(1, 4)])
+
+    def publish_svd(self, release, favourite):
+        """A release whose factors rank ``favourite`` first for every user"""
+        movie_factors = np.zeros((3, 2), dtype=np.float32)
+        movie_factors[[1, 2, 3].index(favourite)] = 1
+        self.stage(release, 'svd', {
+            'movie_ids': np.array([1, 2, 3]),
+            'movie_factors': movie_factors,
+            'user_factors': np.ones((2, 2), dtype=np.float32),
+            'user_ids': [user.id for user in self.users],
+        })
+        publish_release(release, self.model_dir)
+
+    def stored_favourites(self):
+        lists = PrecomputedRecommendation.objects.order_by('user_id').values_list('release', 'recommendations')
+        return [(release, recommendations[0]['movie_id']) for release, recommendations in lists]
+
+    def test_lists_come_from_the_release_they_are_stored_under(self):
+        user_ids = [user.id for user in self.users]
+        self.publish_svd('r1', favourite=1)
+        self.assertEqual(precompute_user_chunk(user_ids, 'r1'), 2)
+        self.assertEqual(self.stored_favourites(), [('r1', 1), ('r1', 1)])
+
+        # The worker would trust its r1 factors for a while without the forced check
+        registry.check_interval = 3600
+        self.publish_svd('r2', favourite=3)
+        self.assertEqual(precompute_user_chunk(user_ids, 'r1'), 0)
+        self.assertEqual(precompute_user_chunk(user_ids, 'r2'), 2)
+        self.assertEqual(self.stored_favourites(), [('r2', 3), ('r2', 3)])
+
+    def test_incrementally_updated_svd_is_not_precomputed_under_the_release(self):
+        self.publish_svd('r1', favourite=1)
+        loaded = registry.get_loaded('svd')
+        publish_if_current({'svd': (loaded, loaded.data)})
+
+        self.assertEqual(precompute_user_chunk([user.id for user in self.users], 'r1'), 0)
+        self.assertFalse(PrecomputedRecommendation.objects.exists())
+
+
+class RecommendationViewTests(PublishedModelsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='viewer')
+        UserProfile.objects.create(user=self.user, assigned_algorithm='hybrid')
+        movies = Movie.objects.bulk_create([
+            Movie(movie_id=movie_id, title=f'Movie {movie_id}', genres='Drama') for movie_id in range(1, 5)
+        ])
+        Rating.objects.create(user=self.user, movie=movies[0], rating=5)
+
+        # Two training users; the first shares the viewer's taste
+        self.stage('r1', 'collaborative', {
+            'user_item_matrix': csr_matrix(np.array([[5, 4, 0, 0], [0, 0, 5, 3]], dtype=np.float32)),
+            'movies_list': [1, 2, 3, 4],
+            'user_ids': [101, 102],
+            'user_id_to_idx': {101: 0, 102: 1},
+        })
+        publish_release('r1', self.model_dir)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, query=''):
+        return self.client.get('/api/recommendations/' + query)
+
+    def test_missing_hybrid_config_falls_back_to_user_user(self):
+        response = self.get('?exhaustive=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['mode'], 'collaborative')
+        self.assertEqual([movie['movie_id'] for movie in response.json()['recommendations']], [2])
+
+    def test_explicitly_requested_missing_model_is_an_error(self):
+        self.assertEqual(self.get('?mode=hybrid').status_code, 500)
+
+    def publish(self, name, data):
+        publish_artifacts({name: self.stage('r2', name, data)}, model_dir=self.model_dir)
+
+    def test_repeated_request_is_a_cache_hit(self):
+        first, second = self.get('?exhaustive=1').json(), self.get('?exhaustive=1').json()
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['recommendations'], first['recommendations'])
+        self.assertEqual(recommendation_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        # Only the computed list is timed for the algorithm comparison
+        self.assertEqual(AlgorithmPerformance.objects.count(), 1)
+
+    def test_rating_a_movie_invalidates_the_cached_lists(self):
+        self.get('?exhaustive=1')
+        client = Client()
+        client.force_login(self.user)
+        client.post('/dashboard/', {'movie_id': 2, 'rating': 4})
+
+        response = self.get('?exhaustive=1').json()
+        self.assertFalse(response['cached'])
+        self.assertEqual(response['recommendations'], [])
+
+    def test_cache_key_follows_the_served_artifact(self):
+        self.get('?exhaustive=1')
+        # Publishing a model the list does not depend on keeps it
+        self.publish('svd', {'movie_ids': np.array([1, 2, 3, 4])})
+        self.assertTrue(self.get('?exhaustive=1').json()['cached'])
+
+        self.publish('collaborative', {
+            'user_item_matrix': csr_matrix(np.array([[5, 0, 4, 0], [0, 5, 0, 3]], dtype=np.float32)),
+            'movies_list': [1, 2, 3, 4],
+            'user_ids': [101, 102],
+            'user_id_to_idx': {101: 0, 102: 1},
+        })
+        response = self.get('?exhaustive=1').json()
+        self.assertFalse(response['cached'])
+        self.assertEqual([movie['movie_id'] for movie in response['recommendations']], [3])
+
+    def test_hybrid_cache_key_follows_the_component_artifacts(self):
+        self.publish('hybrid', {'weights': {'collaborative': 1.0}})
+        self.get('?exhaustive=1')
+        self.assertTrue(self.get('?exhaustive=1').json()['cached'])
+
+        self.publish('collaborative', {
+            'user_item_matrix': csr_matrix(np.array([[5, 0, 4, 0], [0, 5, 0, 3]], dtype=np.float32)),
+            'movies_list': [1, 2, 3, 4],
+            'user_ids': [101, 102],
+            'user_id_to_idx': {101: 0, 102: 1},
+        })
+        response = self.get('?exhaustive=1').json()
+        self.assertEqual(response['mode'], 'hybrid')
+        self.assertFalse(response['cached'])
@@ -0,0 +1,248 @@
+"""
+Training data extraction shared by the model trainers.
+
+Ratings, interactions and movie metadata are streamed with
+``values_list(...).iterator()`` straight into typed NumPy column arrays, so
+no Rating/User/Movie model instances are created during a retrain.
+
+A full retrain exports them once into a snapshot (a single ``.npz`` file of
+column arrays named by its snapshot id); every trainer then reads the
+snapshot instead of scanning the database again.
+"""
+import os
+from itertools import islice
+
+import numpy as np
+from django.utils import timezone
+
+from .models import Movie, Rating, MovieInteraction
+from .model_registry import MODEL_DIR
+
+CHUNK_SIZE = 20000
+
+SNAPSHOT_DIR = os.path.join(MODEL_DIR, 'snapshots')
+# Older snapshots are deleted when a new one is exported
+SNAPSHOTS_TO_KEEP = 3
+
+MOVIE_TEXT_FIELDS = ('title', 'genres', 'director', 'cast', 'plot')
+
+# Implicit feedback weight per interaction type
+IMPLICIT_WEIGHTS = {'watchlist': 0.5}
+DEFAULT_IMPLICIT_WEIGHT = 0.3
+
+
+class RatingArrays:
+    """Aligned column arrays, one entry per rating"""
+
+    def __init__(self, user_ids, movie_ids, ratings, timestamps):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.ratings = ratings
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.ratings)
+
+
+class InteractionArrays:
+    """Aligned column arrays, one entry per implicit interaction"""
+
+    def __init__(self, user_ids, movie_ids, weights):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.weights)
+
+
+class MovieArrays:
+    """Movie ids with their text metadata, one list entry per movie"""
+
+    def __init__(self, movie_ids, title, genres, director, cast, plot):
+        self.movie_ids = movie_ids
+        self.title = title
+        self.genres = genres
+        self.director = director
+        self.cast = cast
+        self.plot = plot
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+
+def _iter_chunks(queryset, chunk_size):
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def load_ratings(chunk_size=CHUNK_SIZE):
+    """Every rating as ``RatingArrays`` (timestamps are Unix seconds)"""
+    queryset = Rating.objects.order_by().values_list('user_id', 'movie__movie_id', 'rating', 'timestamp')
+
+    users, movies, ratings, timestamps = [], [], [], []
+    for chunk in _iter_chunks(queryset, chunk_size):
+        chunk_users, chunk_movies, chunk_ratings, chunk_times = zip(*chunk)
+        users.append(np.array(chunk_users, dtype=np.int64))
+        movies.append(np.array(chunk_movies, dtype=np.int64))
+        ratings.append(np.array(chunk_ratings, dtype=np.float32))
+        timestamps.append(np.fromiter((t.timestamp() for t in chunk_times), dtype=np.int64, count=len(chunk)))
+
+    return RatingArrays(
+        _concat(users, np.int64),
+        _concat(movies, np.int64),
+        _concat(ratings, np.float32),
+        _concat(timestamps, np.int64),
+    )
+
+
+def load_interactions(chunk_size=CHUNK_SIZE):
+    """Every implicit interaction as ``InteractionArrays`` with its feedback weight"""
+    queryset = MovieInteraction.objects.order_by().values_list('user_id', 'movie__movie_id', 'interaction_type')
+
+    users, movies, weights = [], [], []
+    for chunk in _iter_chunks(queryset, chunk_size):
+        chunk_users, chunk_movies, chunk_types = zip(*chunk)
+        users.append(np.array(chunk_users, dtype=np.int64))
+        movies.append(np.array(chunk_movies, dtype=np.int64))
+        weights.append(np.fromiter(
+            (IMPLICIT_WEIGHTS.get(t, DEFAULT_IMPLICIT_WEIGHT) for t in chunk_types),
+            dtype=np.float32, count=len(chunk),
+        ))
+
+    return InteractionArrays(
+        _concat(users, np.int64),
+        _concat(movies, np.int64),
+        _concat(weights, np.float32),
+    )
+
+
+def load_movies():
+    """Every movie as ``MovieArrays``, ordered by movie id"""
+    rows = list(Movie.objects.order_by('movie_id').values_list('movie_id', *MOVIE_TEXT_FIELDS))
+    columns = list(zip(*rows)) if rows else [()] * (len(MOVIE_TEXT_FIELDS) + 1)
+    return MovieArrays(
+        np.array(columns[0], dtype=np.int64),
+        *[[value or '' for value in column] for column in columns[1:]],
+    )
+
+
+# -----------------------------------------------------------
+# SNAPSHOTS
+# -----------------------------------------------------------
+
+def _pack_strings(values):
+    """Store a list of strings as one UTF-8 byte buffer plus end offsets"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(buffer, offsets):
+    data = buffer.tobytes()
+    starts = np.concatenate(([0], offsets[:-1])) if len(offsets) else offsets
+    return [data[start:end].decode('utf-8') for start, end in zip(starts.tolist(), offsets.tolist())]
+
+
+def snapshot_path(snapshot, snapshot_dir=SNAPSHOT_DIR):
+    """Accept either a snapshot id or a path to its file"""
+    if os.path.sep in snapshot or snapshot.endswith('.npz'):
+        return snapshot
+    return os.path.join(snapshot_dir, f'{snapshot}.npz')
+
+
+def export_snapshot(snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE):
+    """
+    Export ratings, interactions and movie metadata in one database pass and
+    return the new snapshot id.
+    """
+    ratings = load_ratings(chunk_size)
+    interactions = load_interactions(chunk_size)
+    movies = load_movies()
+
+    snapshot_id = f"{timezone.now().strftime('%Y%m%dT%H%M%S')}-{len(ratings)}"
+    arrays = {
+        'rating_user_ids': ratings.user_ids,
+        'rating_movie_ids': ratings.movie_ids,
+        'ratings': ratings.ratings,
+        'rating_timestamps': ratings.timestamps,
+        'interaction_user_ids': interactions.user_ids,
+        'interaction_movie_ids': interactions.movie_ids,
+        'interaction_weights': interactions.weights,
+        'movie_ids': movies.movie_ids,
+    }
+    for field in MOVIE_TEXT_FIELDS:
+        arrays[f'movie_{field}'], arrays[f'movie_{field}_offsets'] = _pack_strings(getattr(movies, field))
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = snapshot_path(snapshot_id, snapshot_dir)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+    _prune_snapshots(snapshot_dir)
+    return snapshot_id
+
+
+def _prune_snapshots(snapshot_dir):
+    snapshots = sorted(name for name in os.listdir(snapshot_dir) if name.endswith('.npz'))
+    for name in snapshots[:-SNAPSHOTS_TO_KEEP]:
+        os.remove(os.path.join(snapshot_dir, name))
+
+
+class TrainingSnapshot:
+    """Lazily decoded view over an exported snapshot file"""
+
+    def __init__(self, snapshot):
+        self.path = snapshot_path(snapshot)
+        self.snapshot_id = os.path.splitext(os.path.basename(self.path))[0]
+        self._arrays = np.load(self.path)
+
+    def ratings(self):
+        a = self._arrays
+        return RatingArrays(a['rating_user_ids'], a['rating_movie_ids'], a['ratings'], a['rating_timestamps'])
+
+    def interactions(self):
+        a = self._arrays
+        return InteractionArrays(a['interaction_user_ids'], a['interaction_movie_ids'], a['interaction_weights'])
+
+    def movies(self):
+        a = self._arrays
+        return MovieArrays(
+            a['movie_ids'],
+            *[_unpack_strings(a[f'movie_{field}'], a[f'movie_{field}_offsets']) for field in MOVIE_TEXT_FIELDS],
+        )
+
+
+def get_ratings(snapshot=None):
+    """Ratings from ``snapshot`` when given, otherwise straight from the database"""
+    return TrainingSnapshot(snapshot).ratings() if snapshot else load_ratings()
+
+
+def get_interactions(snapshot=None):
+    return TrainingSnapshot(snapshot).interactions() if snapshot else load_interactions()
+
+
+def get_movies(snapshot=None):
+    return TrainingSnapshot(snapshot).movies() if snapshot else load_movies()
+
+
+def index_of(keys, values):
+    """
+    Positions of ``values`` in the sorted array ``keys``, plus a mask of the
+    values that are actually present.
+    """
+    keys = np.asarray(keys)
+    positions = np.searchsorted(keys, values)
+    positions = np.clip(positions, 0, max(len(keys) - 1, 0))
+    found = keys[positions] == values if len(keys) else np.zeros(len(values), dtype=bool)
+    return positions, found
@@ -44,6 +44,7 @@ urlpatterns = [
     # API
     path('api/recommendations/', views.get_recommendations, name='api_get_recommendations'),
     path('api/recommendations/click/', views.record_recommendation_click, name='api_record_click'),
+    path('api/models/status/', views.model_status, name='api_model_status'),
     # A/B Testing
     #path('admin/ab-testing/', views.ab_testing_dashboard, name='ab_testing_dashboard'),
 ]
@@ -2,29 +2,36 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib.auth.forms import AuthenticationForm
+from django.db import transaction
 from django.db.models import Q, Count, Sum, Avg
 from django.contrib.auth.models import User
 import random
 import os
-import pickle
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 
 from .forms import RegisterForm
+from .model_registry import registry
+from . import recommendation_cache
+from .engines.collaborative import UserUserRecommender, ItemItemRecommender, DEFAULT_NEIGHBORS
+from .engines.svd import SVDRecommender
+from .engines.content import ContentRecommender
+from .engines.hybrid import HybridRecommender
+from .engines.neural import NeuralRecommender, PYTORCH_AVAILABLE
+from .engines.pipeline import UserContext, default_pipeline
+from .tasks import PRECOMPUTED_N
 from .models import (
     UserProfile, UserFollow, Movie, Rating,
     MovieComment, SharedRecommendation,
-    RecommendationExperiment
+    RecommendationExperiment, PrecomputedRecommendation, RatingEvent
 )
 import time
-from abtesting.models import ABTest, ABTestResult  # Use 'abtesting'
+from abtesting.models import ABTest, ABTestResult, AlgorithmComparison, AlgorithmPerformance  # Use 'abtesting'
 
 def get_recommendations_view(request):
     start_time = time.time()
@@ -113,6 +120,32 @@ def profile(request, user_id):
 # -----------------------------------------------------------
 # MOVIE DETAIL
 # -----------------------------------------------------------
+SIMILAR_MOVIES = 6
+
+# Neighbour tables tried in order for the "Similar Movies" section
+SIMILAR_MOVIE_SOURCES = [
+    ('content', ContentRecommender),
+    ('collaborative_item', ItemItemRecommender),
+]
+
+
+def _similar_movies(movie):
+    """Nearest neighbours from the first trained index, genre matches if there is none."""
+    for name, factory in SIMILAR_MOVIE_SOURCES:
+        engine = registry.get_engine(name, factory)
+        similar = engine.similar_movies(movie.movie_id, SIMILAR_MOVIES) if engine is not None else []
+        if similar:
+            movies = Movie.objects.in_bulk([movie_id for movie_id, _ in similar], field_name='movie_id')
+            result = []
+            for movie_id, score in similar:
+                if movie_id in movies:
+                    movies[movie_id].similarity_score = score * 100
+                    result.append(movies[movie_id])
+            return result
+
+    return Movie.objects.filter(genres=movie.genres).exclude(id=movie.id)[:SIMILAR_MOVIES]
+
+
 @login_required
 def movie_detail(request, movie_id):
     movie = get_object_or_404(Movie, movie_id=movie_id)
@@ -121,9 +154,7 @@ def movie_detail(request, movie_id):
     if request.user.is_authenticated:
         user_rating = Rating.objects.filter(user=request.user, movie=movie).first()
 
-    similar_movies = Movie.objects.filter(
-        genres=movie.genres
-    ).exclude(id=movie.id)[:6]
+    similar_movies = _similar_movies(movie)
 
     reviews = MovieComment.objects.filter(movie=movie).order_by('-timestamp')
 
@@ -170,6 +201,16 @@ def login_view(request):
 # -----------------------------------------------------------
 # DASHBOARD
 # -----------------------------------------------------------
+def _update_content_profile(user, movie_id, rating):
+    """Keep the user's cached content profile in step with a new rating."""
+    try:
+        engine = registry.get_engine('content', ContentRecommender)
+        if engine is not None:
+            engine.update_profile(user.id, movie_id, rating)
+    except Exception as e:
+        print(f"[content] failed to update profile: {e}")
+
+
 @login_required
 def dashboard_view(request):
     user_ratings = Rating.objects.filter(user=request.user).select_related('movie')
@@ -184,11 +225,17 @@ def dashboard_view(request):
                 profile, _ = UserProfile.objects.get_or_create(user=request.user)
                 algorithm = profile.assigned_algorithm or 'hybrid'
 
-                rating_obj, created = Rating.objects.update_or_create(
-                    user=request.user,
-                    movie=movie,
-                    defaults={'rating': int(rating_value), 'recommended_by_algorithm': algorithm}
-                )
+                # The outbox event commits together with the rating it announces
+                with transaction.atomic():
+                    rating_obj, created = Rating.objects.update_or_create(
+                        user=request.user,
+                        movie=movie,
+                        defaults={'rating': int(rating_value), 'recommended_by_algorithm': algorithm}
+                    )
+                    RatingEvent.objects.create(user=request.user, rating=rating_obj)
+                _update_content_profile(request.user, movie.movie_id, rating_obj.rating)
+                recommendation_cache.invalidate_user(request.user.id)
+                PrecomputedRecommendation.objects.filter(user=request.user).delete()
 
                 try:
                     exp, _ = RecommendationExperiment.objects.get_or_create(
@@ -255,6 +302,92 @@ def search_users(request):
 # -----------------------------------------------------------
 # RECOMMENDATION API
 # -----------------------------------------------------------
+MAX_RECOMMENDATIONS = 100
+MAX_NEIGHBORS = 500
+MAX_N_PROBE = 1000
+
+# Serving engines selectable with ?mode=; without it the user's assigned
+# algorithm is used when it has an engine, user-user collaborative otherwise
+RECOMMENDATION_MODES = {
+    'collaborative': UserUserRecommender,
+    'collaborative_item': ItemItemRecommender,
+    'svd': SVDRecommender,
+    'content': ContentRecommender,
+    'hybrid': HybridRecommender,
+}
+if PYTORCH_AVAILABLE:
+    RECOMMENDATION_MODES['neural'] = NeuralRecommender
+DEFAULT_MODE = 'collaborative'
+
+# Candidate retrieval + ranking by the selected engine; ?exhaustive=1 scores the full catalogue instead
+RECOMMENDATION_PIPELINE = default_pipeline()
+
+# Modes with nightly top-N lists (see tasks.precompute_recommendations)
+PRECOMPUTED_MODES = {'svd'}
+
+
+def _int_param(request, name, default, min_value, max_value):
+    """Read an integer query parameter, raising ValueError when it is out of range."""
+    raw = request.query_params.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    if not min_value <= value <= max_value:
+        raise ValueError(f"'{name}' must be between {min_value} and {max_value}")
+    return value
+
+
+def _record_performance(user, algorithm, recommendations, response_time):
+    """Store per-request latency so algorithms can be compared on the performance dashboard."""
+    try:
+        comparison, _ = AlgorithmComparison.objects.get_or_create(
+            name="Algorithm Performance Test",
+            defaults={'is_active': True}
+        )
+        AlgorithmPerformance.objects.create(
+            comparison=comparison,
+            algorithm=algorithm,
+            user=user,
+            num_recommendations=len(recommendations),
+            response_time=response_time,
+        )
+    except Exception as e:
+        print(f"[ab-test] failed to record AlgorithmPerformance: {e}")
+
+
+def _cache_version(engine, exhaustive):
+    """
+    Version tags of every artifact a served list depends on: the engine's (for
+    hybrid, its config's and components'), plus the candidate generators'
+    unless the full catalogue was scored. Publishing any of them misses the cache.
+    """
+    versions = [(None, engine.model_version)]
+    if isinstance(engine, HybridRecommender):
+        versions += engine.component_versions()
+    if not exhaustive:
+        versions += RECOMMENDATION_PIPELINE.model_versions()
+    return ','.join(version if name is None else f'{name}={version}' for name, version in versions)
+
+
+def _precomputed_recommendations(user, mode, n):
+    """The user's nightly top-N list for ``mode`` when it is from the live release, else None"""
+    if mode not in PRECOMPUTED_MODES or n > PRECOMPUTED_N:
+        return None
+    release = registry.manifest().get('release')
+    if release is None:
+        return None
+    recommendations = (
+        PrecomputedRecommendation.objects
+        .filter(user=user, algorithm=mode, release=release)
+        .values_list('recommendations', flat=True)
+        .first()
+    )
+    return recommendations[:n] if recommendations is not None else None
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_recommendations(request):
@@ -265,48 +398,67 @@ def get_recommendations(request):
         return Response({'message': 'Please rate some movies first', 'recommendations': []}, status=status.HTTP_200_OK)
 
     try:
-        model_path = os.path.join('ml_models', 'recommender_model.pkl')
-
-        if not os.path.exists(model_path):
-            return Response({'error': 'Model not found. Train model first.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        with open(model_path, 'rb') as f:
-            model_data = pickle.load(f)
-
-        user_item_matrix = model_data['user_item_matrix']
-        movies_list = model_data['movies_list']
-
-        user_ratings_dict = {r.movie.movie_id: r.rating for r in user_ratings}
-        user_vector = np.zeros(len(movies_list))
-
-        for idx, movie_id in enumerate(movies_list):
-            if movie_id in user_ratings_dict:
-                user_vector[idx] = user_ratings_dict[movie_id]
+        n = _int_param(request, 'n', 10, 1, MAX_RECOMMENDATIONS)
+        k = _int_param(request, 'k', DEFAULT_NEIGHBORS, 1, MAX_NEIGHBORS)
+        n_probe = _int_param(request, 'n_probe', None, 0, MAX_N_PROBE)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        similarities = cosine_similarity(user_vector.reshape(1, -1), user_item_matrix)[0]
-        similar_users_idx = np.argsort(similarities)[::-1]
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    if not profile.assigned_algorithm:
+        profile.assigned_algorithm = random.choice(['collaborative', 'content', 'hybrid'])
+        profile.save()
 
-        recommendations_score = np.zeros(len(movies_list))
-        for idx in similar_users_idx[:50]:
-            if similarities[idx] > 0:
-                recommendations_score += user_item_matrix[idx] * similarities[idx]
+    algorithm = profile.assigned_algorithm
 
-        for idx, movie_id in enumerate(movies_list):
-            if movie_id in user_ratings_dict:
-                recommendations_score[idx] = -1
+    default_mode = algorithm if algorithm in RECOMMENDATION_MODES else DEFAULT_MODE
+    mode = request.query_params.get('mode', default_mode)
+    if mode not in RECOMMENDATION_MODES:
+        return Response({'error': f"'mode' must be one of: {', '.join(RECOMMENDATION_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        top_indices = np.argsort(recommendations_score)[::-1][:10]
-        recommended_ids = [movies_list[idx] for idx in top_indices if recommendations_score[idx] > 0]
-        movies = Movie.objects.filter(movie_id__in=recommended_ids)
-
-        result = [{'movie_id': m.movie_id, 'title': m.title, 'genres': m.genres} for m in movies]
+    try:
+        engine = registry.get_engine(mode, RECOMMENDATION_MODES[mode])
+        if engine is None and 'mode' not in request.query_params and mode != DEFAULT_MODE:
+            # The assigned algorithm's model (e.g. the hybrid config) is not published: serve user-user
+            mode = DEFAULT_MODE
+            engine = registry.get_engine(mode, RECOMMENDATION_MODES[mode])
 
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        if not profile.assigned_algorithm:
-            profile.assigned_algorithm = random.choice(['collaborative', 'content', 'hybrid'])
-            profile.save()
+        if engine is None:
+            return Response({'error': 'Model not found. Train model first.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        algorithm = profile.assigned_algorithm
+        exhaustive = request.query_params.get('exhaustive') in ('1', 'true')
+        cache_key = recommendation_cache.cache_key(
+            user.id, mode, _cache_version(engine, exhaustive),
+            n=n, k=k, n_probe=n_probe, exhaustive=exhaustive,
+        )
+
+        start_time = time.perf_counter()
+        timings, stages = {}, {}
+        result = _precomputed_recommendations(user, mode, n) if n_probe is None else None
+        precomputed = result is not None
+        cache_hit = False
+        if not precomputed:
+            result = recommendation_cache.lookup(cache_key)
+            cache_hit = result is not None
+        if result is None:
+            # Newest first, so the pipeline can seed candidates from the latest ratings
+            user_ratings_dict = dict(user_ratings.order_by('-timestamp').values_list('movie__movie_id', 'rating'))
+            if exhaustive:
+                recommended = engine.recommend(user.id, user_ratings_dict, n=n, k=k, n_probe=n_probe, timings=timings)
+            else:
+                context = UserContext(user.id, user_ratings_dict, profile.favorite_genres_list)
+                recommended = RECOMMENDATION_PIPELINE.recommend(engine, context, n=n, stats=stages, k=k, n_probe=n_probe)
+
+            movies = Movie.objects.in_bulk([movie_id for movie_id, _ in recommended], field_name='movie_id')
+            result = [
+                {'movie_id': movie_id, 'title': movies[movie_id].title, 'genres': movies[movie_id].genres, 'score': round(score, 4)}
+                for movie_id, score in recommended if movie_id in movies
+            ]
+            recommendation_cache.store(cache_key, result)
+        response_time = time.perf_counter() - start_time
+        if not (precomputed or cache_hit):
+            # Latency comparisons are between algorithms, not between lookups
+            _record_performance(user, mode, result, response_time)
 
         try:
             exp, _ = RecommendationExperiment.objects.get_or_create(user=user, algorithm_variant=algorithm)
@@ -315,12 +467,35 @@ def get_recommendations(request):
         except Exception as e:
             print(f"[ab-test] failed to update RecommendationExperiment: {e}")
 
-        return Response({'user_id': user.id, 'username': user.username, 'recommendations': result, 'algorithm': algorithm})
+        response = {
+            'user_id': user.id, 'username': user.username, 'recommendations': result, 'algorithm': algorithm,
+            'mode': mode, 'precomputed': precomputed, 'cached': cache_hit, 'response_time_ms': round(response_time * 1000, 2),
+        }
+        if timings:
+            response['component_times_ms'] = timings
+        if stages:
+            response['pipeline'] = stages
+        return Response(response)
 
     except Exception as e:
         return Response({'error': f'Error generating recommendations: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# -----------------------------------------------------------
+# MODEL STATUS
+# -----------------------------------------------------------
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def model_status(request):
+    """Load time and memory footprint of the models held by this worker, and recommendation cache counters."""
+    return Response({
+        'pid': os.getpid(),
+        'release': registry.manifest().get('release'),
+        'models': registry.stats(),
+        'recommendation_cache': recommendation_cache.stats(),
+    })
+
+
 # -----------------------------------------------------------
 # RECORD RECOMMENDATION CLICK
 # -----------------------------------------------------------